@@ -0,0 +1,271 @@
+import json
+import logging
+import re
+import shutil
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import product
+from os.path import getsize, join
+from string import ascii_uppercase
+from tempfile import mkdtemp
+from threading import Thread
+from urllib.parse import urlparse
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+fq_term = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))')
+range_pattern = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def get_isos(number):
+    # Made up three letter codes so any number of countries can be generated
+    return ["".join(letters) for letters in product(ascii_uppercase, repeat=3)][:number]
+
+
+def write_gazetteer(path, units, levels=3):
+    # Sheets adm1 to adm<levels> where each level has four times the units of the
+    # one above
+    workbook = Workbook(write_only=True)
+    for level in range(1, levels + 1):
+        sheet = workbook.create_sheet(f"adm{level}")
+        headers = list()
+        for parent in range(level, 0, -1):
+            headers.extend([f"ADM{parent}_EN", f"ADM{parent}_PCODE"])
+        sheet.append(headers + ["validOn"])
+        for unit in range(units * 4 ** (level - 1)):
+            row = list()
+            for parent in range(level, 0, -1):
+                number = unit // 4 ** (level - parent)
+                row.extend([f"Unit {parent} {number}", f"XX{parent}{number:06d}"])
+            sheet.append(row + ["2023-01-01"])
+    workbook.save(path)
+
+
+def write_population_csv(path, rows, level=1, levels=3):
+    # ADM<level> table where, as in the gazetteer, each unit splits into four
+    # units of the level below. Totals are those of the units' descendants at the
+    # lowest level, so the totals of every level add up.
+    with open(path, "w", encoding="utf-8", newline="") as fp:
+        headers = list()
+        for parent in range(level, 0, -1):
+            headers.extend([f"ADM{parent}_EN", f"ADM{parent}_PCODE"])
+        fp.write(",".join(headers + ["F_TL", "M_TL", "T_TL", "T_00_04", "T_05_09"]) + "\n")
+        descendants = 4 ** (levels - level)
+        for unit in range(rows * 4 ** (level - 1)):
+            row = list()
+            for parent in range(level, 0, -1):
+                number = unit // 4 ** (level - parent)
+                row.extend([f"Unit {parent} {number}", f"XX{parent}{number:06d}"])
+            total = descendants * (2 * unit * descendants + descendants + 1) // 2
+            row.extend([total // 2, total - total // 2, total, unit, unit])
+            fp.write(",".join(str(value) for value in row) + "\n")
+
+
+def write_shapefile_zip(path, features, folder):
+    from geopandas import GeoDataFrame
+    from shapely.geometry import box
+
+    side = max(int(features ** 0.5), 1)
+    layer = GeoDataFrame(
+        {
+            "ADM1_EN": [f"Unit 1 {i}" for i in range(features)],
+            "ADM1_PCODE": [f"XX1{i:06d}" for i in range(features)],
+        },
+        geometry=[box(i % side, i // side, i % side + 1, i // side + 1) for i in range(features)],
+        crs="EPSG:4326",
+    )
+    layer.to_file(join(folder, "xxx_admbnda_adm1.shp"))
+    with ZipFile(path, "w", ZIP_DEFLATED) as z:
+        for extension in ("shp", "shx", "dbf", "prj", "cpg"):
+            z.write(join(folder, f"xxx_admbnda_adm1.{extension}"), f"xxx_admbnda_adm1.{extension}")
+
+
+def generate_cods(folder, countries=10, gazetteer_units=20, ps_rows=1000, features=100):
+    # One file of each kind is written and served for every country so large
+    # numbers of countries are cheap to set up. Returns the COD datasets and a
+    # mapping of file name to path.
+    files = {
+        "gazetteer.xlsx": join(folder, "gazetteer.xlsx"),
+        "population_adm1.csv": join(folder, "population_adm1.csv"),
+        "population_adm2.csv": join(folder, "population_adm2.csv"),
+        "population_adm3.csv": join(folder, "population_adm3.csv"),
+        "boundaries.zip": join(folder, "boundaries.zip"),
+    }
+    write_gazetteer(files["gazetteer.xlsx"], gazetteer_units)
+    for level in range(1, 4):
+        write_population_csv(files[f"population_adm{level}.csv"], ps_rows, level)
+    write_shapefile_zip(files["boundaries.zip"], features, mkdtemp(dir=folder))
+
+    resources = {
+        "ab": [
+            ("gazetteer.xlsx", "XLSX", "Gazetteer", "adm_gazetteer.xlsx"),
+            ("boundaries.zip", "SHP", "Shapefiles", "admbnda_shp.zip"),
+        ],
+        "em": [("gazetteer.xlsx", "XLSX", "Gazetteer", "adm_gazetteer.xlsx")],
+        "ps": [
+            ("population_adm1.csv", "CSV", "Population statistics", "pop_adm1.csv"),
+            ("population_adm2.csv", "CSV", "Population statistics", "pop_adm2.csv"),
+            ("population_adm3.csv", "CSV", "Population statistics", "pop_adm3.csv"),
+        ],
+    }
+    datasets = list()
+    for iso in get_isos(countries):
+        for theme, theme_resources in resources.items():
+            name = f"cod-{theme}-{iso.lower()}"
+            datasets.append(
+                {
+                    "id": f"{name}-id",
+                    "name": name,
+                    "title": f"{iso} - Subnational {theme}",
+                    "notes": "Synthetic COD for benchmarking",
+                    "archived": False,
+                    "cod_level": "cod-standard",
+                    "metadata_modified": "2023-01-01T00:00:00",
+                    "dataset_date": "[2023-01-01T00:00:00 TO 2023-12-31T23:59:59]",
+                    "data_update_frequency": "365",
+                    "license_title": "CC BY-IGO",
+                    "owner_org": "ocha",
+                    "organization": {"name": "ocha", "title": "OCHA"},
+                    "groups": [{"name": iso.lower(), "title": iso}],
+                    "tags": [{"name": "common operational dataset-cod"}],
+                    "resources": [
+                        {
+                            "id": f"{name}-{i}",
+                            "name": f"{iso.lower()}_{resource_name}",
+                            "description": description,
+                            "format": file_format,
+                            "url": f"/files/{iso.lower()}/{i}/{filename}",
+                            "last_modified": "2023-01-01T00:00:00",
+                            "hash": "",
+                            "size": getsize(files[filename]),
+                        }
+                        for i, (filename, file_format, description, resource_name) in enumerate(
+                            theme_resources
+                        )
+                    ],
+                }
+            )
+    return datasets, files
+
+
+def matches_fq(dataset, fq):
+    for field, quoted, value in fq_term.findall(fq or ""):
+        value = quoted or value
+        if field == "vocab_Topics":
+            if not any(fnmatch(tag["name"], value) for tag in dataset.get("tags", [])):
+                return False
+        elif not fnmatch(str(dataset.get(field, "")), value):
+            return False
+    return True
+
+
+class FakeHDXHandler(BaseHTTPRequestHandler):
+    # Answers the CKAN actions the scrapers use and serves the resource files
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        action = urlparse(self.path).path.rstrip("/").split("/")[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        datasets = self.server.datasets
+        if action == "package_search":
+            found = [d for d in datasets if matches_fq(d, data.get("fq"))]
+            start = int(data.get("start", 0))
+            # CKAN caps rows at ckan.search.rows_max, 1000 by default
+            rows = min(int(data.get("rows", 1000)), 1000)
+            page = found[start:start + rows]
+            if data.get("fl"):
+                fields = data["fl"].split(",")
+                page = [{field: d[field] for field in fields if field in d} for d in page]
+            result = {"count": len(found), "results": page}
+        elif action == "package_show":
+            result = next((d for d in datasets if data.get("id") in (d["id"], d["name"])), None)
+        elif action == "group_list":
+            result = list({group["name"]: group for d in datasets for group in d["groups"]}.values())
+        elif action == "organization_show":
+            result = next(
+                (d["organization"] for d in datasets if d["organization"]["name"] == data.get("id")), None
+            )
+        else:
+            result = None
+        if result is None:
+            self.send_json(404, {"success": False, "error": {"__type": "Not Found Error", "message": "Not found"}})
+            return
+        self.send_json(200, {"success": True, "result": result})
+
+    def do_GET(self):
+        path = self.server.files.get(urlparse(self.path).path.split("/")[-1])
+        if not path:
+            self.send_error(404)
+            return
+        size = getsize(path)
+        match = range_pattern.match(self.headers.get("Range", ""))
+        if not match:
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            with open(path, "rb") as fp:
+                shutil.copyfileobj(fp, self.wfile)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        with open(path, "rb") as fp:
+            fp.seek(start)
+            self.wfile.write(fp.read(end - start + 1))
+
+    def do_HEAD(self):
+        path = self.server.files.get(urlparse(self.path).path.split("/")[-1])
+        if not path:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(getsize(path)))
+        self.end_headers()
+
+
+class FakeHDX:
+    # Local stand-in for the HDX CKAN API and its resource downloads. Resource urls
+    # are made absolute once the server has a port.
+    def __init__(self, datasets, files):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHDXHandler)
+        self.server.daemon_threads = True
+        self.server.files = files
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        for dataset in datasets:
+            for resource in dataset["resources"]:
+                resource["url"] = f"{self.url}{resource['url']}"
+        self.server.datasets = datasets
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        logger.info(f"Fake HDX serving {len(self.server.datasets)} datasets at {self.url}")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import warnings
+from os.path import abspath, join
+from tempfile import mkdtemp
+from time import perf_counter
+
+from benchmarks.fake_hdx import FakeHDX, generate_cods, get_isos
+
+warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+
+logger = logging.getLogger(__name__)
+
+benchmarked_scrapers = [
+    "country_ab_summary",
+    "country_em_summary",
+    "country_ps_summary",
+    "check_population_headers",
+    "check_boundary_fields",
+    "boundary_geometry_stats",
+    "population_reconciliation",
+    "pcode_consistency",
+    "metadata_summary",
+    "dataset_resource_descriptions",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark scrapers against a local fake HDX")
+    parser.add_argument("-sc", "--scrapers", default=",".join(benchmarked_scrapers), help="Scrapers to run")
+    parser.add_argument("-nc", "--countries", default=10, type=int, help="Number of synthetic countries")
+    parser.add_argument("-gu", "--gazetteer-units", default=20, type=int, help="ADM1 units in each gazetteer")
+    parser.add_argument("-pr", "--ps-rows", default=1000, type=int, help="Rows in the ADM1 population csv, four times more each level down")
+    parser.add_argument("-bf", "--features", default=100, type=int, help="Features in each boundary shapefile")
+    parser.add_argument("-wk", "--workers", default=1, type=int, help="Countries to process in parallel")
+    parser.add_argument("-pp", "--processes", default=1, type=int, help="Processes to parse downloaded files in")
+    parser.add_argument(
+        "-ri", "--remote-inspection", action="store_true", help="Read boundary zip fields with range requests"
+    )
+    parser.add_argument("-sp", "--search-page-size", default=1000, type=int, help="Datasets per search request")
+    parser.add_argument("-dl", "--downloads-per-second", default=1000, type=int, help="Download rate limit")
+    parser.add_argument("-rp", "--repeat", default=1, type=int, help="Times to run each scraper")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="File for the results")
+    return parser.parse_args()
+
+
+def run_scraper(
+    name,
+    fake_hdx_url,
+    countries,
+    workers,
+    processes,
+    remote_inspection,
+    search_page_size,
+    downloads_per_second,
+    output_folder,
+    results,
+):
+    # Runs in its own process so that peak RSS belongs to this scraper alone
+    from hdx.api.configuration import Configuration
+    from hdx.utilities.useragent import UserAgent
+    from scripts.dataset_index import CODDatasetIndex
+    from scripts.downloads import DownloaderPool
+    from scripts.instrumentation import instrument_configuration, run_report
+    from scripts.parse_pool import ParsePool
+    from scripts.rate_limit import RateLimiter
+    from scripts.registry import get_scrapers
+    from scripts.search_pool import SearchPool
+
+    UserAgent.set_global("cods-summary-benchmark")
+    Configuration.create(hdx_url=fake_hdx_url, hdx_read_only=True)
+    configuration = Configuration.read()
+    instrument_configuration(configuration)
+    os.chdir(output_folder)
+    scraper = get_scrapers([name])[0]
+    start = perf_counter()
+    rate_limiter = RateLimiter(rate=downloads_per_second)
+    rate_limiter.mount(configuration.get_session())
+    with DownloaderPool(rate_limiter=rate_limiter) as downloader_pool, ParsePool(processes) as parse_pool:
+        context = {
+            "configuration": configuration,
+            "countries": countries,
+            "dataset_index": CODDatasetIndex(),
+            "downloader_pool": downloader_pool,
+            "parse_pool": parse_pool,
+            "remote_inspection": remote_inspection,
+            "resume": False,
+            "search_pool": SearchPool(search_page_size),
+            "state": None,
+            "temp_folder": mkdtemp(dir=output_folder),
+            "workers": workers,
+        }
+        with run_report.scope(scraper=name):
+            scraper.function(**{argument: context[argument] for argument in scraper.arguments})
+    seconds = perf_counter() - start
+    stages = dict(run_report.get_report()["scrapers"][name]["totals"])
+    results.put(
+        {
+            "scraper": name,
+            "seconds": seconds,
+            "countries_per_second": len(countries) / seconds,
+            "megabytes_per_second": stages.get("download_bytes", 0) / 1024 / 1024 / seconds,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "stages": stages,
+        }
+    )
+
+
+def main():
+    args = parse_args()
+    work_folder = mkdtemp(prefix="cods-benchmark-")
+    # Errors are logged to the work folder so benchmark runs leave nothing in the repo
+    error_log = logging.FileHandler(join(work_folder, "errors.log"))
+    error_log.setLevel(logging.ERROR)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        handlers=[logging.StreamHandler(), error_log],
+    )
+    logger.info(f"Generating {args.countries} synthetic countries in {work_folder}")
+    datasets, files = generate_cods(
+        work_folder, args.countries, args.gazetteer_units, args.ps_rows, args.features
+    )
+    countries = get_isos(args.countries)
+    # fork so children share the already imported modules and the server socket
+    context = multiprocessing.get_context("fork")
+    benchmarks = list()
+    with FakeHDX(datasets, files) as fake_hdx:
+        for name in args.scrapers.split(","):
+            for _ in range(args.repeat):
+                results = context.Queue()
+                process = context.Process(
+                    target=run_scraper,
+                    args=(
+                        name,
+                        fake_hdx.url,
+                        countries,
+                        args.workers,
+                        args.processes,
+                        args.remote_inspection,
+                        args.search_page_size,
+                        args.downloads_per_second,
+                        mkdtemp(dir=work_folder),
+                        results,
+                    ),
+                )
+                process.start()
+                process.join()
+                if process.exitcode != 0 or results.empty():
+                    logger.error(f"{name} failed with exit code {process.exitcode}")
+                    continue
+                result = results.get()
+                logger.info(
+                    f"{name}: {result['seconds']:.2f}s, {result['countries_per_second']:.1f} countries/s, "
+                    f"peak RSS {result['peak_rss_mb']:.0f}MB"
+                )
+                benchmarks.append(result)
+
+    with open(args.output, "w") as fp:
+        json.dump(
+            {
+                "parameters": {
+                    "countries": args.countries,
+                    "gazetteer_units": args.gazetteer_units,
+                    "ps_rows": args.ps_rows,
+                    "features": args.features,
+                    "workers": args.workers,
+                    "processes": args.processes,
+                    "remote_inspection": args.remote_inspection,
+                    "search_page_size": args.search_page_size,
+                    "downloads_per_second": args.downloads_per_second,
+                },
+                "benchmarks": benchmarks,
+            },
+            fp,
+            indent=2,
+        )
+    logger.info(f"Wrote benchmark results to {abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
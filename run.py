@@ -3,21 +3,27 @@ import logging
 import warnings
 from os import getenv
 from os.path import expanduser, join
+from time import perf_counter
+
+# Taken before the other imports so that the startup time reported includes them
+started = perf_counter()
 
 from hdx.api.configuration import Configuration
 from hdx.facades.keyword_arguments import facade
 from hdx.location.country import Country
-from hdx.utilities.downloader import Download
 from hdx.utilities.errors_onexit import ErrorsOnExit
 from hdx.utilities.path import temp_dir
-from scripts.check_boundary_fields import check_boundary_fields
-from scripts.check_population_headers import check_population_headers
-from scripts.country_ab_summary import country_ab_summary
-from scripts.country_em_summary import country_em_summary
-from scripts.country_ps_summary import country_ps_summary
-from scripts.cowboy_cods import cowboy_cods
-from scripts.dataset_resource_descriptions import dataset_resource_descriptions
-from scripts.metadata_summary import metadata_summary
+from scripts.cassette import Cassette
+from scripts.dataset_index import CODDatasetIndex
+from scripts.downloads import DownloaderPool
+from scripts.incremental import IncrementalState
+from scripts.instrumentation import instrument_configuration, run_report
+from scripts.parse_pool import ParsePool
+from scripts.rate_limit import RateLimiter
+from scripts.registry import get_scrapers
+from scripts.resource_cache import ResourceCache
+from scripts.scheduler import run_scrapers
+from scripts.search_pool import SearchPool, get_subscribers
 
 warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
 
@@ -31,6 +37,25 @@ def parse_args():
     parser.add_argument("-hs", "--hdxsite", default=None, help="HDX site")
     parser.add_argument("-sc", "--scrapers", default=None, help="Scrapers to run")
     parser.add_argument("-co", "--countries", default=None, help="Which countries to check")
+    parser.add_argument("-wk", "--workers", default=None, help="Countries to process in parallel")
+    parser.add_argument("-ps", "--parallel-scrapers", default=None, help="Scrapers to run at the same time")
+    parser.add_argument("-pp", "--processes", default=None, help="Processes to parse downloaded files in")
+    parser.add_argument("-rl", "--rate-limit", default=None, help="Starting calls per second to each host")
+    parser.add_argument("-cd", "--cache-dir", default=None, help="Folder for persistent resource cache")
+    parser.add_argument("-cs", "--cache-size", default=None, help="Resource cache size limit in MB")
+    parser.add_argument("-ss", "--scratch-size", default=None, help="Disk space for downloads being processed in MB")
+    parser.add_argument("-sp", "--search-page-size", default=None, help="Datasets to fetch per search request")
+    parser.add_argument(
+        "-in", "--incremental", action="store_true", help="Only reprocess datasets changed since the last run"
+    )
+    parser.add_argument(
+        "-rs", "--resume", action="store_true", help="Skip countries finished by an interrupted run"
+    )
+    parser.add_argument(
+        "-ri", "--remote-inspection", action="store_true", help="Read boundary zip fields with range requests"
+    )
+    parser.add_argument("-rc", "--record", default=None, help="Folder to record HDX responses and downloads to")
+    parser.add_argument("-rp", "--replay", default=None, help="Folder of a recorded run to replay without network")
     args = parser.parse_args()
     return args
 
@@ -38,35 +63,88 @@ def parse_args():
 def main(
     scrapers_to_run,
     countries,
+    workers,
+    parallel_scrapers,
+    processes,
+    rate_limit,
+    cache_dir,
+    cache_size,
+    scratch_size,
+    search_page_size,
+    incremental,
+    resume,
+    remote_inspection,
+    record,
+    replay,
     **ignore,
 ):
+    cassette = None
+    if record:
+        cassette = Cassette(record, "record")
+    if replay:
+        cassette = Cassette(replay, "replay")
+
+    scrapers = get_scrapers(scrapers_to_run)
+
     if not countries or countries == "all":
-        countries = [key for key in Country.countriesdata()["countries"]]
+        countries = None
+        # Only loaded when needed, from the packaged list when replaying so that
+        # recorded and replayed runs cover the same countries
+        if any("countries" in scraper.arguments for scraper in scrapers):
+            countries = [key for key in Country.countriesdata(use_live=cassette is None)["countries"]]
 
     configuration = Configuration.read()
+    # Mounted after the rate limiter so that replayed responses are not rate limited
+    rate_limiter = RateLimiter(rate=rate_limit)
+    rate_limiter.mount(configuration.get_session())
+    if cassette:
+        cassette.mount(configuration.get_session())
+    instrument_configuration(configuration)
+    dataset_index = CODDatasetIndex()
+    search_pool = SearchPool(search_page_size, subscribers=get_subscribers(scrapers, parallel_scrapers))
+    resource_cache = None
+    if cache_dir:
+        resource_cache = ResourceCache(cache_dir, cache_size * 1024 * 1024)
+    state = None
+    if incremental:
+        state = IncrementalState("incremental_state.json")
     with ErrorsOnExit() as errors_on_exit:
         with temp_dir() as temp_folder:
-            with Download(rate_limit={"calls": 1, "period": 0.1}) as downloader:
+            with DownloaderPool(
+                rate_limiter=rate_limiter,
+                cache=resource_cache,
+                cassette=cassette,
+                scratch_size=scratch_size * 1024 * 1024,
+            ) as downloader_pool, ParsePool(processes) as parse_pool:
                 open("errors.txt", "w").close()
 
                 if scrapers_to_run:
                     logger.info(f"Running only scrapers: {scrapers_to_run}")
-                if "metadata_summary" in scrapers_to_run:
-                    metadata_summary(configuration)
-                if "check_population_headers" in scrapers_to_run:
-                    check_population_headers(downloader, countries)
-                if "check_boundary_fields" in scrapers_to_run:
-                    check_boundary_fields(configuration, countries, temp_folder)
-                if "cowboy_cods" in scrapers_to_run:
-                    cowboy_cods(errors_on_exit)
-                if "country_ab_summary" in scrapers_to_run:
-                    country_ab_summary(countries, temp_folder)
-                if "country_em_summary" in scrapers_to_run:
-                    country_em_summary(countries, temp_folder)
-                if "country_ps_summary" in scrapers_to_run:
-                    country_ps_summary(countries, temp_folder)
-                if "dataset_resource_descriptions" in scrapers_to_run:
-                    dataset_resource_descriptions()
+                context = {
+                    "configuration": configuration,
+                    "countries": countries,
+                    "dataset_index": dataset_index,
+                    "downloader_pool": downloader_pool,
+                    "errors_on_exit": errors_on_exit,
+                    "parse_pool": parse_pool,
+                    "remote_inspection": remote_inspection,
+                    "resume": resume,
+                    "search_pool": search_pool,
+                    "state": state,
+                    "temp_folder": temp_folder,
+                    "workers": workers,
+                }
+                startup_seconds = perf_counter() - started
+                run_report.add(startup_seconds=startup_seconds)
+                logger.info(f"Started up in {startup_seconds:.2f}s")
+                run_scrapers(scrapers, context, errors_on_exit, parallel_scrapers)
+
+                if state:
+                    state.save()
+                run_report.write()
+                rate_limiter.log_stats()
+                if cassette:
+                    cassette.log_stats()
 
             if len(errors_on_exit.errors) > 0:
                 with open("errors.txt", "w") as fp:
@@ -91,10 +169,59 @@ if __name__ == "__main__":
         countries = countries.split(",")
     if countries is None:
         countries = "all"
+    workers = args.workers
+    if workers is None:
+        workers = getenv("WORKERS", 1)
+    workers = int(workers)
+    parallel_scrapers = args.parallel_scrapers
+    if parallel_scrapers is None:
+        parallel_scrapers = getenv("PARALLEL_SCRAPERS", 4)
+    parallel_scrapers = int(parallel_scrapers)
+    processes = args.processes
+    if processes is None:
+        processes = getenv("PROCESSES", 1)
+    processes = int(processes)
+    rate_limit = args.rate_limit
+    if rate_limit is None:
+        rate_limit = getenv("RATE_LIMIT", 10)
+    rate_limit = float(rate_limit)
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache_dir = getenv("RESOURCE_CACHE_DIR")
+    cache_size = args.cache_size
+    if cache_size is None:
+        cache_size = getenv("RESOURCE_CACHE_SIZE", 2048)
+    cache_size = int(cache_size)
+    scratch_size = args.scratch_size
+    if scratch_size is None:
+        scratch_size = getenv("SCRATCH_SIZE", 4096)
+    scratch_size = int(scratch_size)
+    search_page_size = args.search_page_size
+    if search_page_size is None:
+        search_page_size = getenv("SEARCH_PAGE_SIZE", 1000)
+    search_page_size = int(search_page_size)
+    incremental = args.incremental or getenv("INCREMENTAL", "").lower() in ("1", "true", "yes")
+    resume = args.resume or getenv("RESUME", "").lower() in ("1", "true", "yes")
+    remote_inspection = args.remote_inspection or getenv("REMOTE_INSPECTION", "").lower() in ("1", "true", "yes")
+    if args.record and args.replay:
+        raise ValueError("Cannot both record and replay a run")
     facade(
         main,
         scrapers_to_run=scrapers_to_run,
         countries=countries,
+        workers=workers,
+        parallel_scrapers=parallel_scrapers,
+        processes=processes,
+        rate_limit=rate_limit,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        scratch_size=scratch_size,
+        search_page_size=search_page_size,
+        incremental=incremental,
+        resume=resume,
+        remote_inspection=remote_inspection,
+        record=args.record,
+        replay=args.replay,
         hdx_site=hdx_site,
         hdx_read_only=True,
         user_agent_config_yaml=join(expanduser("~"), ".useragents.yaml"),
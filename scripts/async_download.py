@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from contextvars import copy_context
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+from scripts.downloads import download_resource, release_resource
+
+logger = logging.getLogger(__name__)
+
+
+async def download_resources(downloader_pool, resources, folder, concurrency=4, cancelled=None):
+    # Downloads run in threads (each with its own Download from the pool so they
+    # share its rate limit) with at most concurrency of them in flight or waiting
+    # to be taken. Once cancelled is set, downloads that have not started are
+    # skipped.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(index, resource):
+        await semaphore.acquire()
+        if cancelled and cancelled.is_set():
+            return index, None, None
+        try:
+            resource_file = await asyncio.to_thread(download_resource, downloader_pool, resource, folder)
+        except Exception as ex:
+            return index, None, ex
+        return index, resource_file, None
+
+    for future in asyncio.as_completed([fetch(i, r) for i, r in enumerate(resources)]):
+        result = await future
+        try:
+            yield result
+        finally:
+            # The next download only starts once this one has been taken
+            semaphore.release()
+
+
+def iter_downloads(downloader_pool, resources, folder, concurrency=4):
+    # Yields (position in resources, downloaded file or None, error or None) as each
+    # download finishes so callers can parse one file while the rest download. At
+    # most concurrency finished downloads wait for the caller before downloading
+    # pauses. If the caller stops early, downloads still to start are skipped and
+    # files it was never given are released.
+    completed = Queue(maxsize=concurrency)
+    cancelled = Event()
+    context = copy_context()
+
+    def put(result):
+        # Waits for room in the queue unless the caller has gone
+        while not cancelled.is_set():
+            try:
+                completed.put(result, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    async def produce():
+        async for result in download_resources(downloader_pool, resources, folder, concurrency, cancelled):
+            # The put runs in a thread so a full queue never blocks the event loop
+            if await asyncio.to_thread(put, result):
+                continue
+            if result[1]:
+                release_resource(downloader_pool, result[1])
+
+    def run():
+        try:
+            # Run in the caller's context so downloads are attributed to its scraper
+            context.run(asyncio.run, produce())
+        except Exception as ex:
+            logger.error(f"Download engine failed: {ex}")
+        finally:
+            put(None)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = completed.get()
+            if result is None:
+                break
+            yield result
+    finally:
+        cancelled.set()
+        # Queued files are released while downloads in flight finish, as those may
+        # be waiting for the scratch space the queued files hold
+        while thread.is_alive() or not completed.empty():
+            try:
+                result = completed.get(timeout=0.1)
+            except Empty:
+                continue
+            if result and result[1]:
+                release_resource(downloader_pool, result[1])
+        thread.join()
@@ -0,0 +1,121 @@
+import logging
+from itertools import islice
+from os.path import getsize, splitext
+from zipfile import ZipFile
+
+import fiona
+from numpy import array, empty, fmax, fmin, full, isnan, nan
+from shapely import (
+    GeometryType,
+    from_ragged_array,
+    get_num_coordinates,
+    is_empty,
+    is_missing,
+    is_valid,
+    total_bounds,
+)
+from shapely.errors import GEOSException
+from shapely.geometry import shape
+
+from scripts.boundary_schema import is_shapefile
+from scripts.instrumentation import timed_parse
+
+logger = logging.getLogger(__name__)
+
+
+def list_boundary_layers(resource_file, file_type):
+    # Returns (path GDAL can open the layer with, file name in the zip, uncompressed
+    # size in bytes) for each layer. The size of a shapefile layer is that of all
+    # of its files.
+    if file_type != "shp":
+        return [(resource_file, None, getsize(resource_file))]
+    layers = list()
+    with ZipFile(resource_file, "r") as z:
+        infos = z.infolist()
+        for info in infos:
+            if not is_shapefile(info.filename):
+                continue
+            stem, _ = splitext(info.filename)
+            size = sum(i.file_size for i in infos if splitext(i.filename)[0].lower() == stem.lower())
+            # The braces stop GDAL looking for .zip in the name, which downloaded
+            # files have before their .shp extension
+            layers.append((f"/vsizip/{{{resource_file}}}/{info.filename}", info.filename, size))
+    return layers
+
+
+def read_polygons(geometries):
+    # Polygons and multipolygons built in one go, all as multipolygons, from
+    # their coordinates. This is many times faster than building each one.
+    coords = list()
+    ring_offsets = [0]
+    polygon_offsets = [0]
+    offsets = [0]
+    for geometry in geometries:
+        polygons = geometry.coordinates
+        if geometry.type == "Polygon":
+            polygons = [polygons]
+        for polygon in polygons:
+            for ring in polygon:
+                coords.extend(ring)
+                ring_offsets.append(len(coords))
+            polygon_offsets.append(len(ring_offsets) - 1)
+        offsets.append(len(polygon_offsets) - 1)
+    return from_ragged_array(
+        GeometryType.MULTIPOLYGON,
+        array(coords, dtype=float),
+        (array(ring_offsets), array(polygon_offsets), array(offsets)),
+    )
+
+
+def read_geometries(features):
+    # Shapely geometries of a batch of features with None for null geometries.
+    # Returns them with the number that could not even be built, like rings of
+    # fewer than four points, which are None too.
+    geometries = empty(len(features), dtype=object)
+    polygonal = [
+        i for i, feature in enumerate(features)
+        if feature.geometry and feature.geometry.type in ("Polygon", "MultiPolygon")
+    ]
+    polygonal_set = set(polygonal)
+    others = [i for i, feature in enumerate(features) if feature.geometry and i not in polygonal_set]
+    if polygonal:
+        try:
+            geometries[polygonal] = read_polygons([features[i].geometry for i in polygonal])
+        except (ValueError, GEOSException):
+            # One bad ring or a mix of 2D and 3D coordinates fails the whole
+            # batch, which is then built a feature at a time
+            others = [i for i, feature in enumerate(features) if feature.geometry]
+    unbuildable = 0
+    for i in others:
+        try:
+            geometries[i] = shape(features[i].geometry)
+        except (ValueError, GEOSException):
+            unbuildable += 1
+    return geometries, unbuildable
+
+
+@timed_parse("geometry")
+def measure_layer(path, batch_size=10000):
+    # Feature, vertex, invalid and empty geometry counts and the bounding box of a
+    # layer. Features are read a batch at a time and each batch measured with
+    # shapely's array functions, so memory does not grow with the layer.
+    stats = {"features": 0, "vertices": 0, "invalid": 0, "empty": 0, "bounds": None}
+    bounds = full(4, nan)
+    with fiona.open(path) as layer:
+        features = iter(layer)
+        while True:
+            batch = list(islice(features, batch_size))
+            if not batch:
+                break
+            geometries, unbuildable = read_geometries(batch)
+            missing = is_missing(geometries)
+            stats["features"] += len(batch)
+            stats["vertices"] += int(get_num_coordinates(geometries).sum())
+            stats["invalid"] += int((~is_valid(geometries) & ~missing).sum()) + unbuildable
+            stats["empty"] += int((is_empty(geometries) | missing).sum()) - unbuildable
+            batch_bounds = total_bounds(geometries)
+            bounds[:2] = fmin(bounds[:2], batch_bounds[:2])
+            bounds[2:] = fmax(bounds[2:], batch_bounds[2:])
+    if not isnan(bounds).any():
+        stats["bounds"] = [float(value) for value in bounds]
+    return stats
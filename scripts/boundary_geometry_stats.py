@@ -0,0 +1,146 @@
+import logging
+from functools import partial
+from zipfile import BadZipFile
+
+from hdx.utilities.downloader import DownloadError
+from scripts.boundary_geometry import list_boundary_layers, measure_layer
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import download_resource, release_resource
+from scripts.incremental import run_incremental
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
+
+logger = logging.getLogger(__name__)
+
+
+def boundary_geometry_stats(
+        countries,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        workers=1,
+        state=None,
+        parse_pool=None,
+        resume=False,
+):
+    logger.info(f"Measuring boundary geometries")
+
+    results = [
+        [
+            "ISO",
+            "resource name",
+            "file name",
+            "size",
+            "features",
+            "vertices",
+            "invalid geometries",
+            "empty geometries",
+            "min x",
+            "min y",
+            "max x",
+            "max y",
+            "error",
+        ]
+    ]
+
+    measure = partial(
+        measure_country,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        state=state,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("boundary_geometry_stats.csv", resume)
+    for rows in map_countries(partial(checkpoint.run, measure), countries, workers):
+        results.extend(rows)
+
+    checkpoint.finish(results)
+
+    logger.info("Wrote out boundary geometry stats")
+    return
+
+
+def measure_country(
+        iso,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        state,
+        parse_pool,
+):
+    dataset = dataset_index.get("ab", iso)
+    if not dataset:
+        return []
+
+    return run_incremental(
+        state,
+        "boundary_geometry_stats",
+        dataset,
+        partial(measure_dataset, iso, dataset, downloader_pool, temp_folder, parse_pool),
+    )
+
+
+def measure_dataset(
+        iso,
+        dataset,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    resources = [r for r in dataset.get_resources() if r.get_format().lower() in ["shp", "geojson"]]
+    if len(resources) == 0:
+        logger.error(f"{iso}: could not find resources from {dataset['name']}")
+        return [[iso] + [None] * 11 + ["Could not find shp or json boundary resource"]], True
+
+    rows = list()
+    complete = True
+    for resource in resources:
+        row = [iso, resource["name"]] + [None] * 11
+        try:
+            resource_file = download_resource(downloader_pool, resource, temp_folder)
+        except DownloadError:
+            logger.error(f"{iso}: could not download {resource['name']}")
+            row[12] = "Could not download boundary resource"
+            rows.append(row)
+            complete = False
+            continue
+        try:
+            rows.extend(measure_resource(row, resource_file, resource.get_format().lower(), parse_pool))
+        finally:
+            release_resource(downloader_pool, resource_file)
+    return rows, complete
+
+
+def measure_resource(row, resource_file, file_type, parse_pool):
+    try:
+        layers = list_boundary_layers(resource_file, file_type)
+    except BadZipFile:
+        logger.error(f"{row[0]}: could not unzip {row[1]}")
+        row[12] = "Could not unzip boundary resource"
+        return [row]
+    if len(layers) == 0:
+        row[12] = "Could not find shp in zip"
+        return [row]
+
+    # Every layer is submitted before waiting on any so that layers are measured
+    # in parallel when there are several parse processes
+    futures = [parse_pool.submit(measure_layer, path) for path, _, _ in layers]
+    rows = list()
+    for (_, name, size), future in zip(layers, futures):
+        row = row[:2] + [name, size] + [None] * 9
+        try:
+            stats = parse_pool.get(future)
+        except Exception as ex:
+            logger.error(f"{row[0]}: could not read {name}: {ex}")
+            row[12] = "Could not read file"
+            rows.append(row)
+            continue
+        row[4] = stats["features"]
+        row[5] = stats["vertices"]
+        row[6] = stats["invalid"]
+        row[7] = stats["empty"]
+        if stats["bounds"]:
+            row[8:12] = stats["bounds"]
+        rows.append(row)
+    return rows
@@ -0,0 +1,123 @@
+import logging
+from mmap import ACCESS_READ, mmap
+from os.path import basename, splitext
+from struct import unpack
+from zipfile import BadZipFile, ZipFile
+
+import ijson
+
+from scripts.instrumentation import run_report, timed_parse
+
+logger = logging.getLogger(__name__)
+
+
+def read_dbf_header(fp, encoding="utf-8"):
+    # The dBase header holds the record count and a 32 byte descriptor per field
+    # so the schema can be read without touching any records or geometries
+    header = fp.read(32)
+    if len(header) < 32:
+        raise ValueError("Truncated dbf header")
+    records, header_length = unpack("<IH", header[4:10])
+    descriptors = fp.read(header_length - 32)
+    fields = list()
+    for i in range(0, len(descriptors) - 31, 32):
+        descriptor = descriptors[i:i + 32]
+        if descriptor[0] == 0x0D:
+            break
+        name = descriptor[:11].split(b"\x00")[0]
+        try:
+            fields.append(name.decode(encoding))
+        except (LookupError, UnicodeDecodeError):
+            fields.append(name.decode("latin-1"))
+    return fields, records
+
+
+class MappedFile(mmap):
+    # ZipFile checks seekable which mmap only has from Python 3.13
+    def seekable(self):
+        return True
+
+
+@timed_parse("dbf")
+def inspect_shapefile_zip(resource_file):
+    # Returns a list of layers, one per shp in the zip, each a dictionary with the
+    # path of the shp inside the zip, its field names and its number of features.
+    # The zip is memory mapped so members are read without extracting them.
+    with open(resource_file, "rb") as fp:
+        try:
+            mapped = MappedFile(fp.fileno(), 0, access=ACCESS_READ)
+        except ValueError:
+            raise BadZipFile("File is empty")
+        with mapped:
+            return read_shapefile_zip(mapped)
+
+
+def is_shapefile(name):
+    # Skips the resource forks macOS adds to zips
+    stem, extension = splitext(name)
+    return extension.lower() == ".shp" and "__macosx" not in name.lower() and not basename(stem).startswith("._")
+
+
+def read_shapefile_zip(fp):
+    layers = list()
+    with ZipFile(fp, "r") as z:
+        members = {name.lower(): name for name in z.namelist()}
+        for name in z.namelist():
+            if not is_shapefile(name):
+                continue
+            stem, _ = splitext(name)
+            layer = {"file": name, "fields": None, "features": None, "error": None}
+            layers.append(layer)
+            dbf = members.get(f"{stem}.dbf".lower())
+            if not dbf:
+                layer["error"] = "Missing dbf"
+                continue
+            encoding = "utf-8"
+            cpg = members.get(f"{stem}.cpg".lower())
+            if cpg:
+                encoding = z.read(cpg).decode("ascii", errors="ignore").strip() or encoding
+            try:
+                with z.open(dbf) as fp:
+                    layer["fields"], layer["features"] = read_dbf_header(fp, encoding)
+            except Exception as ex:
+                layer["error"] = str(ex)
+    return layers
+
+
+@timed_parse("ijson")
+def inspect_geojson(resource_file):
+    # Streams the GeoJSON taking field names from the first feature's properties
+    # and counting features without building any geometries
+    fields = list()
+    features = 0
+    with open(resource_file, "rb") as fp:
+        for prefix, event, value in ijson.parse(fp):
+            if prefix == "features.item" and event == "start_map":
+                features += 1
+            elif features == 1 and prefix == "features.item.properties" and event == "map_key":
+                fields.append(value)
+    return [{"file": resource_file, "fields": fields, "features": features, "error": None}]
+
+
+def inspect_boundary_layers(resource_file, file_type, load_geometry=False):
+    # Schema of each layer in a boundary resource. Geometries are only read, into
+    # a "layer" GeoDataFrame, when load_geometry is set.
+    if file_type == "shp":
+        layers = inspect_shapefile_zip(resource_file)
+    else:
+        try:
+            layers = inspect_geojson(resource_file)
+        except ijson.JSONError as ex:
+            layers = [{"file": resource_file, "fields": None, "features": None, "error": str(ex)}]
+    if load_geometry:
+        from geopandas import read_file
+
+        for layer in layers:
+            if layer["error"]:
+                continue
+            path = resource_file
+            if file_type == "shp":
+                path = f"zip://{resource_file}!{layer['file']}"
+            with run_report.timed("parse_read_file"):
+                layer["layer"] = read_file(path)
+    return layers
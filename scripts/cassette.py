@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+from hashlib import sha256
+from os.path import exists, join
+from threading import Lock
+
+from requests import exceptions
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3 import HTTPResponse
+
+from hdx.utilities.uuid import get_uuid
+
+logger = logging.getLogger(__name__)
+
+
+class Cassette:
+    # Records every HTTP response made through the sessions it is mounted on into
+    # folder, or in replay mode answers those requests from folder with no network
+    def __init__(self, folder, mode):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}")
+        if mode == "replay" and not exists(folder):
+            raise FileNotFoundError(f"No recording found in {folder}")
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.mode = mode
+        self.lock = Lock()
+        self.recorded = 0
+        self.replayed = 0
+
+    def mount(self, session):
+        for prefix in ("https://", "http://"):
+            session.mount(prefix, CassetteAdapter(self, session.get_adapter(prefix)))
+
+    def get_path(self, request):
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key = f"{request.method} {request.url}\n"
+        if "Range" in request.headers:
+            key = f"{key}Range: {request.headers['Range']}\n"
+        key = sha256(key.encode("utf-8") + body).hexdigest()
+        return join(self.folder, key)
+
+    def count(self, attribute):
+        with self.lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def log_stats(self):
+        if self.mode == "record":
+            logger.info(f"Recorded {self.recorded} responses to {self.folder}")
+        else:
+            logger.info(f"Replayed {self.replayed} responses from {self.folder}")
+
+
+class CassetteAdapter(BaseAdapter):
+    def __init__(self, cassette, adapter):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+        self.builder = HTTPAdapter()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        path = self.cassette.get_path(request)
+        if self.cassette.mode == "record":
+            response = self.adapter.send(
+                request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies
+            )
+            self.record(path, request, response)
+            self.cassette.count("recorded")
+        elif not exists(f"{path}.json"):
+            raise exceptions.ConnectionError(f"No recorded response for {request.method} {request.url}")
+        else:
+            self.cassette.count("replayed")
+        response = self.replay(path, request)
+        if not stream:
+            response.content
+        return response
+
+    def record(self, path, request, response):
+        # The body is kept as sent, still content encoded, so that replaying it
+        # goes through exactly the same decoding
+        temp_path = f"{path}.{get_uuid()}"
+        try:
+            with open(f"{temp_path}.body", "wb") as fp:
+                for chunk in response.raw.stream(65536, decode_content=False):
+                    fp.write(chunk)
+        finally:
+            response.close()
+        with open(f"{temp_path}.json", "w") as fp:
+            json.dump(
+                {
+                    "method": request.method,
+                    "url": request.url,
+                    "status": response.status_code,
+                    "reason": response.reason,
+                    "headers": list(response.raw.headers.items()),
+                },
+                fp,
+            )
+        os.replace(f"{temp_path}.body", f"{path}.body")
+        os.replace(f"{temp_path}.json", f"{path}.json")
+
+    def replay(self, path, request):
+        with open(f"{path}.json") as fp:
+            recorded = json.load(fp)
+        raw = HTTPResponse(
+            body=open(f"{path}.body", "rb"),
+            headers=recorded["headers"],
+            status=recorded["status"],
+            reason=recorded["reason"],
+            preload_content=False,
+            decode_content=False,
+            request_method=request.method,
+        )
+        return self.builder.build_response(request, raw)
+
+    def close(self):
+        self.adapter.close()
+        self.builder.close()
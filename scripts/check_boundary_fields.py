@@ -1,16 +1,19 @@
 import logging
-import re
-
-from geopandas import read_file
-from glob import glob
-from os.path import join
-from zipfile import BadZipFile, ZipFile
-
-from hdx.data.dataset import Dataset
-from hdx.data.hdxobject import HDXError
-from hdx.utilities.dictandlist import write_list_to_csv
-from hdx.utilities.downloader import DownloadError
-from hdx.utilities.uuid import get_uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from contextvars import copy_context
+from functools import partial
+from zipfile import BadZipFile
+
+from scripts.async_download import iter_downloads
+from scripts.boundary_schema import inspect_boundary_layers
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import release_resource
+from scripts.header_classifier import cache_stats, classify_headers
+from scripts.instrumentation import run_report
+from scripts.parse_pool import ParsePool
+from scripts.remote_file import inspect_remote_shapefile_zip
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +21,17 @@ logger = logging.getLogger(__name__)
 def check_boundary_fields(
     configuration,
     countries,
+    dataset_index,
+    downloader_pool,
     temp_folder,
+    workers=1,
+    state=None,
+    parse_pool=None,
+    resume=False,
+    remote_inspection=False,
 ):
     logger.info(f"Summarizing boundary fields")
+    parse_pool = parse_pool or ParsePool()
 
     results = [
         [
@@ -35,19 +46,37 @@ def check_boundary_fields(
         ]
     ]
 
-    for iso in countries:
+    # Rows are keyed by (country position, resource position) so that they can be
+    # written out in order whichever download finishes first
+    country_rows = dict()
+    refreshed = dict()
+    # Countries with a failed download are not stored in the incremental state so
+    # that they are tried again on the next run
+    failed = set()
+    downloads = list()
+    pending = dict()
+    checkpoint = Checkpoint("boundary_dataset_headers.csv", resume)
+    for i, iso in enumerate(countries):
         row = [iso, None, None, None, None, None, None, None]
 
-        dataset_name = f"cod-ab-{iso.lower()}"
-        try:
-            dataset = Dataset.read_from_hdx(dataset_name)
-        except HDXError:
+        if checkpoint.has(iso):
+            country_rows[(i, 0)] = checkpoint.get(iso)
             continue
+
+        dataset = dataset_index.get("ab", iso)
         if not dataset:
             continue
 
+        if state:
+            entry = state.get("check_boundary_fields", dataset)
+            if entry:
+                country_rows[(i, 0)] = entry["rows"]
+                checkpoint.add(iso, entry["rows"])
+                continue
+            refreshed[i] = dataset
+
         row[1] = dataset.get_hdx_url().split("/")[-1]
-        row[2] = dataset.get_organization()["title"]
+        row[2] = dataset["organization"]["title"]
 
         resources = dataset.get_resources()
         resource_list = []
@@ -57,75 +86,140 @@ def check_boundary_fields(
 
         if len(resource_list) == 0:
             row[3] = "Could not find shp or json boundary resource"
-            results.append(row)
-            logger.error(f"{iso}: could not find resources from {dataset_name}")
+            country_rows[(i, 0)] = [row]
+            logger.error(f"{iso}: could not find resources from {dataset['name']}")
+            if i in refreshed:
+                state.set("check_boundary_fields", dataset, [row])
+            checkpoint.add(iso, [row])
             continue
 
-        for resource in resource_list:
-            row = row[:3] + [None] * 5
+        pending[i] = len(resource_list)
+        for j, resource in enumerate(resource_list):
+            downloads.append(((i, j), row[:3], resource))
+
+    def finish_resource(i):
+        # Once all resources of a country are done its rows are journaled
+        pending[i] -= 1
+        if pending[i] > 0:
+            return
+        rows = [row for key in sorted(country_rows) if key[0] == i for row in country_rows[key]]
+        if i in refreshed and i not in failed:
+            state.set("check_boundary_fields", refreshed[i], rows)
+        checkpoint.add(countries[i], rows)
+
+    def collect(key):
+        row, future = parses.pop(key)
+        with run_report.scope(iso=row[0]):
+            country_rows[key] = read_boundary_fields(row, partial(parse_pool.get, future))
+        finish_resource(key[0])
+
+    if remote_inspection:
+        # Shapefile zips are inspected with range requests for their central
+        # directory and dbf headers, falling back to downloading them whole
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            inspections = list()
+            for key, row, resource in downloads:
+                if resource.get_format() != "shp":
+                    continue
+                future = executor.submit(copy_context().run, inspect_remote_shapefile_zip, downloader_pool, resource)
+                inspections.append((key, row, resource, future))
+        downloads = [d for d in downloads if d[2].get_format() != "shp"]
+        for key, row, resource, future in inspections:
+            error = future.exception()
+            if error and not isinstance(error, BadZipFile):
+                logger.info(f"{row[0]}: downloading {resource['name']} as it could not be inspected remotely: {error}")
+                downloads.append((key, row, resource))
+                continue
+            row = row + [None] * 5
             row[4] = resource["name"]
-            try:
-                _, resource_file = resource.download(folder=temp_folder)
-            except DownloadError:
+            with run_report.scope(iso=row[0]):
+                country_rows[key] = read_boundary_fields(row, future.result)
+            finish_resource(key[0])
+
+    # Each file is handed to the parse pool as soon as it is downloaded and its
+    # layers collected as soon as the parse is done
+    parses = dict()
+    # closing stops and cleans up the downloads straight away if this loop fails
+    with closing(iter_downloads(downloader_pool, [d[2] for d in downloads], temp_folder, workers)) as downloaded:
+        for index, resource_file, error in downloaded:
+            key, row, resource = downloads[index]
+            row = row + [None] * 5
+            row[4] = resource["name"]
+            if error:
                 row[3] = "Could not download boundary resource"
-                results.append(row)
-                logger.error(f"{iso}: could not download resource")
+                country_rows[key] = [row]
+                logger.error(f"{row[0]}: could not download resource")
+                failed.add(key[0])
+                finish_resource(key[0])
                 continue
+            with run_report.scope(iso=row[0]):
+                future = parse_pool.submit(inspect_boundary_layers, resource_file, resource.get_format())
+            # Only the layer schemas are needed once the file has been parsed
+            future.add_done_callback(partial(release_file, downloader_pool, resource_file))
+            parses[key] = (row, future)
+            for done in [k for k, (_, future) in parses.items() if future.done()]:
+                collect(done)
 
-            if resource.get_file_type() == "shp":
-                temp_dir = join(temp_folder, get_uuid())
-                try:
-                    with ZipFile(resource_file, "r") as z:
-                        z.extractall(temp_dir)
-                except BadZipFile:
-                    row[3] = "Could not unzip boundary resource"
-                    results.append(row)
-                    logger.error(f"{iso}: could not unzip file!")
-                    continue
-                out_files = glob(join(temp_dir, "**", "*.shp"), recursive=True)
-            else:
-                out_files = [resource_file]
-
-            if len(out_files) == 0:
-                row[3] = "Could not find shp in zip"
-                results.append(row)
-                logger.error(f"{iso}: could not find shp in zip!")
-                continue
+    for key in sorted(parses):
+        collect(key)
 
-            for out_file in out_files:
-                row = row[:5] + [None] * 3
+    for key in sorted(country_rows):
+        results.extend(country_rows[key])
 
-                try:
-                    boundary_lyr = read_file(out_file)
-                except:
-                    logger.error(f"{iso}: could not open {out_file}")
-                    row[3] = "Could not read file"
-                    results.append(row)
-                    continue
+    checkpoint.finish(results)
 
-                fields = boundary_lyr.columns
-                pcode_fields = []
-                name_fields = []
-                for field in fields:
-                    codematch = bool(re.search("p?code", field, re.IGNORECASE))
-                    namematch = bool(re.search("name|_(en|fr|es|ru)$", field, re.IGNORECASE))
-                    levelmatch = bool(
-                        re.search("(^\d\D)|(\D\d\D)|(\D\d$)", field, re.IGNORECASE)
-                    )
-                    if codematch and levelmatch:
-                        pcode_fields.append(field)
-                    if namematch and levelmatch:
-                        name_fields.append(field)
+    logger.info(f"Header classifier cache: {cache_stats()}")
+    logger.info("Wrote out boundary fields")
+    return
 
-                if len(pcode_fields) > 0:
-                    row[6] = ", ".join(list(set(pcode_fields)))
 
-                if len(name_fields) > 0:
-                    row[7] = ", ".join(list(set(name_fields)))
+def release_file(downloader_pool, resource_file, future):
+    release_resource(downloader_pool, resource_file)
+
+
+def read_boundary_fields(row, get_layers):
+    iso = row[0]
+    rows = list()
+    try:
+        layers = get_layers()
+    except BadZipFile:
+        row[3] = "Could not unzip boundary resource"
+        logger.error(f"{iso}: could not unzip file!")
+        return [row]
+    except BrokenProcessPool:
+        raise
+    except Exception as ex:
+        # Any other failure to open or parse the resource, like a GDAL error or a
+        # malformed dbf header, only fails this resource
+        row[3] = "Could not read file"
+        logger.error(f"{iso}: could not read {row[4]}: {ex}")
+        return [row]
+
+    if len(layers) == 0:
+        row[3] = "Could not find shp in zip"
+        logger.error(f"{iso}: could not find shp in zip!")
+        return [row]
+
+    for layer in layers:
+        row = row[:5] + [None] * 3
+
+        if layer["error"]:
+            logger.error(f"{iso}: could not open {layer['file']}")
+            row[3] = "Could not read file"
+            rows.append(row)
+            continue
 
-                results.append(row)
+        fields = layer["fields"]
+        field_classes = classify_headers(fields)
+        pcode_fields = [f for f, c in zip(fields, field_classes) if c.pcode]
+        name_fields = [f for f, c in zip(fields, field_classes) if c.boundary_name]
 
-    write_list_to_csv("boundary_dataset_headers.csv", results)
+        if len(pcode_fields) > 0:
+            row[6] = ", ".join(list(set(pcode_fields)))
 
-    logger.info("Wrote out boundary fields")
-    return
+        if len(name_fields) > 0:
+            row[7] = ", ".join(list(set(name_fields)))
+
+        rows.append(row)
+
+    return rows
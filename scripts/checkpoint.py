@@ -0,0 +1,87 @@
+import csv
+import json
+import logging
+import os
+from os.path import exists
+from threading import Lock
+
+from hdx.utilities.dictandlist import write_list_to_csv
+
+logger = logging.getLogger(__name__)
+
+
+def write_csv_atomically(path, rows, headers=None):
+    # A crash while writing leaves the previous output in place rather than a
+    # truncated file
+    temp_path = f"{path}.partial"
+    write_list_to_csv(temp_path, rows, headers=headers)
+    if exists(temp_path):
+        os.replace(temp_path, path)
+
+
+def write_rows_atomically(path, rows):
+    # Writes rows as they come from an iterable so that they never all need to
+    # be in memory. Returns the number of rows written.
+    temp_path = f"{path}.partial"
+    count = 0
+    with open(temp_path, "w", encoding="utf-8", newline="") as fp:
+        writer = csv.writer(fp)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+class Checkpoint:
+    # Journal of the result of each finished country of a scraper, appended as
+    # countries finish. With resume a rerun after a crash takes the results of
+    # countries already in the journal instead of processing them again. The
+    # journal is removed once the output has been written.
+    def __init__(self, output, resume=False):
+        self.output = output
+        self.path = f"{output}.journal"
+        self.lock = Lock()
+        self.results = dict()
+        if resume and exists(self.path):
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line may be cut short by the crash
+                        continue
+                    self.results[entry["key"]] = entry["result"]
+            logger.info(f"Resuming {output} with {len(self.results)} finished countries")
+        # Rewritten rather than appended to so that a cut short line is dropped
+        self.fp = open(self.path, "w")
+        for key, result in self.results.items():
+            self.fp.write(f"{json.dumps({'key': key, 'result': result})}\n")
+        self.fp.flush()
+
+    def has(self, key):
+        return key in self.results
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def add(self, key, result):
+        line = json.dumps({"key": key, "result": result})
+        with self.lock:
+            self.results[key] = result
+            self.fp.write(f"{line}\n")
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+
+    def run(self, function, key):
+        # Result of function(key) from the journal or by running it and journaling
+        if self.has(key):
+            return self.get(key)
+        result = function(key)
+        self.add(key, result)
+        return result
+
+    def finish(self, rows, headers=None):
+        write_csv_atomically(self.output, rows, headers=headers)
+        self.fp.close()
+        os.remove(self.path)
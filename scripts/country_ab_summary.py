@@ -1,19 +1,27 @@
 import logging
-import re
+from functools import partial
 
-from pandas import read_excel
 
-from hdx.data.dataset import Dataset
-from hdx.data.hdxobject import HDXError
-from hdx.utilities.dictandlist import write_list_to_csv
 from hdx.utilities.downloader import DownloadError
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import download_resource, release_resource
+from scripts.gazetteer import count_gazetteer_units, find_gazetteer_resources
+from scripts.incremental import run_incremental
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
 
 logger = logging.getLogger(__name__)
 
 
 def country_ab_summary(
         countries,
+        dataset_index,
+        downloader_pool,
         temp_folder,
+        workers=1,
+        state=None,
+        parse_pool=None,
+        resume=False,
 ):
     logger.info(f"Summarizing COD AB by country")
 
@@ -30,64 +38,95 @@ def country_ab_summary(
         "COD-AB ADM4 units",
     ]
 
-    for iso in countries:
-        country_info = dict.fromkeys(headers)
-        country_info["ISO"] = iso
+    summarize = partial(
+        summarize_country,
+        headers=headers,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        state=state,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("country_ab_summary.csv", resume)
+    for country_info in map_countries(partial(checkpoint.run, summarize), countries, workers):
+        if country_info:
+            results.append(country_info)
 
-        dataset = None
-        try:
-            dataset = Dataset.read_from_hdx(f"cod-ab-{iso.lower()}")
-        except HDXError:
-            continue
-        if not dataset:
-            continue
-        if dataset["archived"]:
-            continue
+    checkpoint.finish(results, headers=headers)
 
-        country_info["COD-AB URL"] = dataset.get_hdx_url()
-        country_info["COD-AB contributor"] = dataset.get_organization()["title"]
-        country_info["COD-AB description"] = dataset["notes"]
-
-        level = dataset.get("cod_level")
-        if not level:
-            logger.error(f"Dataset missing level {dataset['name']}")
-        country_info["COD-AB level"] = level
-
-        resources = [r for r in dataset.get_resources() if r.get_format() in ["xls", "xlsx"]]
-        if len(resources) > 1:
-            resources = [r for r in resources if "gazetteer" in r["description"].lower() or
-                         "taxonomy" in r["description"].lower() or
-                         bool(re.match(".*adm.*tabular.?data.*", r["name"], re.IGNORECASE))]
-        if len(resources) == 0:
-            logger.warning(f"Cannot find gazetteer for COD-AB {iso}")
-            if len([c for c in country_info.values() if c]) > 1:
-                results.append(country_info)
-            continue
+    logger.info("Wrote out country AB summary")
+    return
+
+
+def summarize_country(
+        iso,
+        headers,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        state,
+        parse_pool,
+):
+    dataset = dataset_index.get("ab", iso)
+    if not dataset:
+        return None
+    if dataset["archived"]:
+        return None
+
+    return run_incremental(
+        state,
+        "country_ab_summary",
+        dataset,
+        partial(summarize_dataset, iso, dataset, headers, downloader_pool, temp_folder, parse_pool),
+    )
+
+
+def summarize_dataset(
+        iso,
+        dataset,
+        headers,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    country_info = dict.fromkeys(headers)
+    country_info["ISO"] = iso
 
-        if len(resources) > 1:
-            logger.warning(f"Found more than one gazetteer for COD-AB {iso}")
-
-        for resource in resources:
-            try:
-                _, resource_file = resource.download(folder=temp_folder)
-            except DownloadError:
-                logger.error(f"Could not download gazetteer for COD-AB {iso}")
-                continue
-
-            contents = read_excel(resource_file, sheet_name=None)
-            for sheet_name, sheet in contents.items():
-                level = re.search("adm(in)?.?[1-7]", sheet_name, re.IGNORECASE)
-                if not level:
-                    continue
-                sheet.dropna(axis=0, how="all", inplace=True)
-                adm_level = level.group()[-1]
-                rows = len(sheet)
-                country_info[f"COD-AB ADM{adm_level} units"] = rows
+    country_info["COD-AB URL"] = dataset.get_hdx_url()
+    country_info["COD-AB contributor"] = dataset["organization"]["title"]
+    country_info["COD-AB description"] = dataset["notes"]
 
+    level = dataset.get("cod_level")
+    if not level:
+        logger.error(f"Dataset missing level {dataset['name']}")
+    country_info["COD-AB level"] = level
+
+    resources = find_gazetteer_resources(dataset)
+    if len(resources) == 0:
+        logger.warning(f"Cannot find gazetteer for COD-AB {iso}")
         if len([c for c in country_info.values() if c]) > 1:
-            results.append(country_info)
+            return country_info, True
+        return None, True
 
-    write_list_to_csv("country_ab_summary.csv", results, headers=headers)
+    if len(resources) > 1:
+        logger.warning(f"Found more than one gazetteer for COD-AB {iso}")
 
-    logger.info("Wrote out country AB summary")
-    return
+    complete = True
+    for resource in resources:
+        try:
+            resource_file = download_resource(downloader_pool, resource, temp_folder)
+        except DownloadError:
+            logger.error(f"Could not download gazetteer for COD-AB {iso}")
+            complete = False
+            continue
+
+        try:
+            units = parse_pool.parse(count_gazetteer_units, resource_file)
+        finally:
+            release_resource(downloader_pool, resource_file)
+        for adm_level, rows in units.items():
+            country_info[f"COD-AB ADM{adm_level} units"] = rows
+
+    if len([c for c in country_info.values() if c]) > 1:
+        return country_info, complete
+    return None, complete
@@ -1,20 +1,29 @@
 import logging
 import re
+from functools import partial
 
-from pandas import read_excel
 from requests import get
 
-from hdx.data.dataset import Dataset
-from hdx.data.hdxobject import HDXError
-from hdx.utilities.dictandlist import write_list_to_csv
 from hdx.utilities.downloader import DownloadError
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import download_resource, release_resource
+from scripts.gazetteer import count_gazetteer_units
+from scripts.incremental import run_incremental
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
 
 logger = logging.getLogger(__name__)
 
 
 def country_em_summary(
         countries,
+        dataset_index,
+        downloader_pool,
         temp_folder,
+        workers=1,
+        state=None,
+        parse_pool=None,
+        resume=False,
 ):
     logger.info(f"Summarizing COD EM by country")
 
@@ -31,61 +40,94 @@ def country_em_summary(
         "COD-EM ADM4 units",
     ]
 
-    for iso in countries:
-        country_info = dict.fromkeys(headers)
-        country_info["ISO"] = iso
-
-        dataset = None
-        try:
-            dataset = Dataset.read_from_hdx(f"cod-em-{iso.lower()}")
-        except HDXError:
-            continue
-        if not dataset:
-            continue
-        if dataset["archived"]:
-            continue
-
-        country_info["COD-EM URL"] = dataset.get_hdx_url()
-        country_info["COD-EM contributor"] = dataset.get_organization()["title"]
-        country_info["COD-EM description"] = dataset["notes"]
-
-        level = dataset.get("cod_level")
-        if not level:
-            logger.error(f"Dataset missing level {dataset['name']}")
-        country_info["COD-EM level"] = level
-
-        resources = [r for r in dataset.get_resources() if r.get_format() in ["xls", "xlsx"]]
-        if len(resources) > 1:
-            resources = [
-                r for r in resources if bool(re.match(
-                    "(.*adm(in)?.?boundaries.?tabular.?data.*)|(.*adm_?ga?z.*)|(.*gazetteer.*)|(.*adm.*)",
-                    r["name"], re.IGNORECASE
-                ))
-            ]
-        if len(resources) == 0:
-            logger.warning(f"Cannot find gazetteer for COD-EM {iso}")
-            continue
-
-        try:
-            _, resource_file = resources[0].download(folder=temp_folder)
-        except DownloadError:
-            logger.error(f"Could not download gazetteer for COD-EM {iso}")
-            continue
-
-        contents = read_excel(resource_file, sheet_name=None)
-        for sheet_name, sheet in contents.items():
-            level = re.search("adm(in)?.?[1-7]", sheet_name, re.IGNORECASE)
-            if not level:
-                continue
-            sheet.dropna(axis=0, how="all", inplace=True)
-            adm_level = level.group()[-1]
-            rows = len(sheet)
-            country_info[f"COD-EM ADM{adm_level} units"] = rows
-
-        if len([c for c in country_info.values() if c]) > 1:
+    summarize = partial(
+        summarize_country,
+        headers=headers,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        state=state,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("country_em_summary.csv", resume)
+    for country_info in map_countries(partial(checkpoint.run, summarize), countries, workers):
+        if country_info:
             results.append(country_info)
 
-    write_list_to_csv("country_em_summary.csv", results, headers=headers)
+    checkpoint.finish(results, headers=headers)
 
     logger.info("Wrote out country EM summary")
     return
+
+
+def summarize_country(
+        iso,
+        headers,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        state,
+        parse_pool,
+):
+    dataset = dataset_index.get("em", iso)
+    if not dataset:
+        return None
+    if dataset["archived"]:
+        return None
+
+    return run_incremental(
+        state,
+        "country_em_summary",
+        dataset,
+        partial(summarize_dataset, iso, dataset, headers, downloader_pool, temp_folder, parse_pool),
+    )
+
+
+def summarize_dataset(
+        iso,
+        dataset,
+        headers,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    country_info = dict.fromkeys(headers)
+    country_info["ISO"] = iso
+
+    country_info["COD-EM URL"] = dataset.get_hdx_url()
+    country_info["COD-EM contributor"] = dataset["organization"]["title"]
+    country_info["COD-EM description"] = dataset["notes"]
+
+    level = dataset.get("cod_level")
+    if not level:
+        logger.error(f"Dataset missing level {dataset['name']}")
+    country_info["COD-EM level"] = level
+
+    resources = [r for r in dataset.get_resources() if r.get_format() in ["xls", "xlsx"]]
+    if len(resources) > 1:
+        resources = [
+            r for r in resources if bool(re.match(
+                "(.*adm(in)?.?boundaries.?tabular.?data.*)|(.*adm_?ga?z.*)|(.*gazetteer.*)|(.*adm.*)",
+                r["name"], re.IGNORECASE
+            ))
+        ]
+    if len(resources) == 0:
+        logger.warning(f"Cannot find gazetteer for COD-EM {iso}")
+        return None, True
+
+    try:
+        resource_file = download_resource(downloader_pool, resources[0], temp_folder)
+    except DownloadError:
+        logger.error(f"Could not download gazetteer for COD-EM {iso}")
+        return None, False
+
+    try:
+        units = parse_pool.parse(count_gazetteer_units, resource_file)
+    finally:
+        release_resource(downloader_pool, resource_file)
+    for adm_level, rows in units.items():
+        country_info[f"COD-EM ADM{adm_level} units"] = rows
+
+    if len([c for c in country_info.values() if c]) > 1:
+        return country_info, True
+    return None, True
@@ -1,19 +1,27 @@
 import logging
 import re
+from functools import partial
 
-from pandas import read_csv
-
-from hdx.data.dataset import Dataset
-from hdx.data.hdxobject import HDXError
-from hdx.utilities.dictandlist import write_list_to_csv
 from hdx.utilities.downloader import DownloadError
+from scripts.checkpoint import Checkpoint
+from scripts.csv_rows import count_csv_rows
+from scripts.downloads import download_resource, release_resource
+from scripts.incremental import run_incremental
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
 
 logger = logging.getLogger(__name__)
 
 
 def country_ps_summary(
         countries,
+        dataset_index,
+        downloader_pool,
         temp_folder,
+        workers=1,
+        state=None,
+        parse_pool=None,
+        resume=False,
 ):
     logger.info(f"Summarizing COD PS by country")
 
@@ -30,74 +38,107 @@ def country_ps_summary(
         "COD-PS ADM4 units",
     ]
 
-    for iso in countries:
-        country_info = dict.fromkeys(headers)
-        country_info["ISO"] = iso
-
-        dataset = None
-        try:
-            dataset = Dataset.read_from_hdx(f"cod-ps-{iso.lower()}")
-        except HDXError:
-            continue
-        if not dataset:
-            continue
-        if dataset["archived"]:
-            continue
-
-        country_info["COD-PS URL"] = dataset.get_hdx_url()
-        country_info["COD-PS contributor"] = dataset.get_organization()["title"]
-        country_info["COD-PS description"] = dataset["notes"]
-
-        level = dataset.get("cod_level")
-        if not level:
-            logger.error(f"Dataset missing level {dataset['name']}")
-        country_info["COD-PS level"] = level
-
-        resources = [r for r in dataset.get_resources() if r.get_format() == "csv"]
-        if len(resources) == 0:
-            logger.warning(f"No csv resources found for {dataset['name']}")
-
-        missing_levels = []
-        for adm_level in ["1", "2", "3", "4"]:
-            adm_resources = [
-                r for r in resources if bool(re.match(f".*adm(in)?_?{adm_level}.*", r["name"], re.IGNORECASE))
-            ]
-            if len(adm_resources) == 0:
-                missing_levels.append(adm_level)
-                continue
-
-            if len(adm_resources) > 1:
-                logger.warning(f"Multiple adm{adm_level} resources for {dataset['name']}")
-
-            try:
-                _, resource_file = adm_resources[0].download(folder=temp_folder)
-            except DownloadError:
-                logger.error(f"Could not download adm{adm_level} pop spreadsheet for {iso}")
-                continue
-            try:
-                contents = read_csv(resource_file)
-            except:
-                try:
-                    contents = read_csv(resource_file, encoding="latin-1")
-                except:
-                    logger.error(f"Could not open adm{adm_level} pop spreadsheet for {iso}")
-                    continue
-
-            contents.dropna(axis=0, how="all", inplace=True)
-            rows = len(contents)
-            cell0 = contents.iloc[0, 0]
-            if str(cell0)[0] == "#":
-                rows = len(contents) - 1
-            country_info[f"COD-PS ADM{adm_level} units"] = rows
-
-        expected_missing_levels = [str(i) for i in range(5-len(missing_levels), 5)]
-        if missing_levels != expected_missing_levels:
-            logger.error(f"{iso} missing unexpected levels: {missing_levels}")
-
-        if len([c for c in country_info.values() if c]) > 1:
+    summarize = partial(
+        summarize_country,
+        headers=headers,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        state=state,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("country_ps_summary.csv", resume)
+    for country_info in map_countries(partial(checkpoint.run, summarize), countries, workers):
+        if country_info:
             results.append(country_info)
 
-    write_list_to_csv("country_ps_summary.csv", results, headers=headers)
+    checkpoint.finish(results, headers=headers)
 
     logger.info("Wrote out country PS summary")
     return
+
+
+def summarize_country(
+        iso,
+        headers,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        state,
+        parse_pool,
+):
+    dataset = dataset_index.get("ps", iso)
+    if not dataset:
+        return None
+    if dataset["archived"]:
+        return None
+
+    return run_incremental(
+        state,
+        "country_ps_summary",
+        dataset,
+        partial(summarize_dataset, iso, dataset, headers, downloader_pool, temp_folder, parse_pool),
+    )
+
+
+def summarize_dataset(
+        iso,
+        dataset,
+        headers,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    country_info = dict.fromkeys(headers)
+    country_info["ISO"] = iso
+
+    country_info["COD-PS URL"] = dataset.get_hdx_url()
+    country_info["COD-PS contributor"] = dataset["organization"]["title"]
+    country_info["COD-PS description"] = dataset["notes"]
+
+    level = dataset.get("cod_level")
+    if not level:
+        logger.error(f"Dataset missing level {dataset['name']}")
+    country_info["COD-PS level"] = level
+
+    resources = [r for r in dataset.get_resources() if r.get_format() == "csv"]
+    if len(resources) == 0:
+        logger.warning(f"No csv resources found for {dataset['name']}")
+
+    missing_levels = []
+    complete = True
+    for adm_level in ["1", "2", "3", "4"]:
+        adm_resources = [
+            r for r in resources if bool(re.match(f".*adm(in)?_?{adm_level}.*", r["name"], re.IGNORECASE))
+        ]
+        if len(adm_resources) == 0:
+            missing_levels.append(adm_level)
+            continue
+
+        if len(adm_resources) > 1:
+            logger.warning(f"Multiple adm{adm_level} resources for {dataset['name']}")
+
+        try:
+            resource_file = download_resource(downloader_pool, adm_resources[0], temp_folder)
+        except DownloadError:
+            logger.error(f"Could not download adm{adm_level} pop spreadsheet for {iso}")
+            complete = False
+            continue
+        try:
+            rows, hxl, _ = parse_pool.parse(count_csv_rows, resource_file)
+        except Exception:
+            logger.error(f"Could not open adm{adm_level} pop spreadsheet for {iso}")
+            continue
+        finally:
+            release_resource(downloader_pool, resource_file)
+        if hxl:
+            logger.info(f"{iso}: adm{adm_level} pop spreadsheet has an HXL hashtag row, not counted as a unit")
+        country_info[f"COD-PS ADM{adm_level} units"] = rows
+
+    expected_missing_levels = [str(i) for i in range(5-len(missing_levels), 5)]
+    if missing_levels != expected_missing_levels:
+        logger.error(f"{iso} missing unexpected levels: {missing_levels}")
+
+    if len([c for c in country_info.values() if c]) > 1:
+        return country_info, complete
+    return None, complete
@@ -1,27 +1,28 @@
 import logging
 
-from hdx.data.dataset import Dataset
+from scripts.search_pool import cod_topic_query
 
 logger = logging.getLogger(__name__)
 
 
-def cowboy_cods(errors_on_exit):
+def cowboy_cods(errors_on_exit, search_pool):
     logger.info("Finding cowboy CODs")
 
-    datasets = Dataset.search_in_hdx(fq='vocab_Topics:"common operational dataset-cod"')
+    dataset_names = list()
+    names_without_level = list()
+    for dataset in search_pool.iter_datasets(cod_topic_query, fields=["name", "cod_level"]):
+        dataset_names.append(dataset.get("name"))
+        if not dataset.get("cod_level"):
+            names_without_level.append(dataset.get("name"))
 
-    if len(datasets) == 0:
+    if len(dataset_names) == 0:
         return
 
-    dataset_names = ",".join([d.get("name") for d in datasets])
-    errors_on_exit.add(f"Found {len(datasets)} dataset(s) with COD tags: {dataset_names}")
+    errors_on_exit.add(f"Found {len(dataset_names)} dataset(s) with COD tags: {','.join(dataset_names)}")
 
-    datasets_without_level = [d for d in datasets if not d.get("cod_level")]
-
-    if len(datasets_without_level) == 0:
+    if len(names_without_level) == 0:
         return
 
-    dataset_names = ",".join([d.get("name") for d in datasets_without_level])
-    errors_on_exit.add(f"Found {len(datasets_without_level)} cowboy COD(s): {dataset_names}")
+    errors_on_exit.add(f"Found {len(names_without_level)} cowboy COD(s): {','.join(names_without_level)}")
 
     return
@@ -0,0 +1,103 @@
+import csv
+import logging
+
+from numpy import zeros
+from pandas import read_csv
+
+from scripts.csv_rows import sniff_encoding
+from scripts.instrumentation import timed_parse
+
+logger = logging.getLogger(__name__)
+
+
+def sniff_delimiter(resource_file, encoding, prefix_size=65536):
+    with open(resource_file, encoding=encoding, errors="replace", newline="") as fp:
+        prefix = fp.read(prefix_size)
+    try:
+        return csv.Sniffer().sniff(prefix, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def get_header_names(labels):
+    # Same field names frictionless gives: blank labels become fieldN and repeated
+    # labels get a number suffix
+    names = [label.replace("\n", " ").strip() for label in labels]
+    names = [name or f"field{i + 1}" for i, name in enumerate(names)]
+    if len(names) != len(set(names)):
+        seen_names = list()
+        for i, name in enumerate(names):
+            count = seen_names.count(name) + 1
+            seen_names.append(name)
+            if count > 1:
+                names[i] = f"{name}{count}"
+    return names
+
+
+@timed_parse("csv")
+def read_csv_header(resource_file):
+    # Returns (header names, encoding, delimiter, rows up to and including the
+    # header). Leading blank rows are skipped so data reads must skip them too.
+    encoding = sniff_encoding(resource_file)
+    delimiter = sniff_delimiter(resource_file, encoding)
+    with open(resource_file, encoding=encoding, errors="replace", newline="") as fp:
+        for i, labels in enumerate(csv.reader(fp, delimiter=delimiter)):
+            if labels:
+                return get_header_names(labels), encoding, delimiter, i + 1
+    return [], encoding, delimiter, 0
+
+
+@timed_parse("read_csv")
+def find_filled_columns(resource_file, columns, encoding, delimiter, header_rows=1, chunksize=100000):
+    try:
+        return scan_filled_columns(resource_file, columns, encoding, delimiter, header_rows, chunksize)
+    except UnicodeDecodeError:
+        # The encoding was guessed from a prefix so a bad byte can still turn up later
+        logger.warning(f"{resource_file} is not {encoding} - reading as latin-1")
+        return scan_filled_columns(resource_file, columns, "latin-1", delimiter, header_rows, chunksize)
+
+
+def scan_filled_columns(resource_file, columns, encoding, delimiter, header_rows, chunksize):
+    # Reads the data rows in chunks and flags each column that has at least one
+    # non-empty cell, stopping as soon as every column has been seen filled
+    filled = zeros(columns, dtype=bool)
+    chunks = read_csv(
+        resource_file,
+        sep=delimiter,
+        encoding=encoding,
+        header=None,
+        skiprows=header_rows,
+        names=range(columns),
+        usecols=range(columns),
+        dtype=str,
+        na_filter=False,
+        chunksize=chunksize,
+    )
+    with chunks:
+        for chunk in chunks:
+            filled |= (chunk.notna() & (chunk != "")).to_numpy().any(axis=0)
+            if filled.all():
+                break
+    return filled
+
+
+def read_csv_columns(resource_file, encoding, delimiter, header_rows, usecols):
+    # Data rows of the given columns as strings, read as latin-1 if the sniffed
+    # encoding turns out to be wrong further into the file
+    def read(encoding):
+        return read_csv(
+            resource_file,
+            sep=delimiter,
+            encoding=encoding,
+            header=None,
+            skiprows=header_rows,
+            usecols=usecols,
+            dtype=str,
+            na_filter=False,
+        )
+
+    try:
+        return read(encoding)
+    except UnicodeDecodeError:
+        logger.warning(f"{resource_file} is not {encoding} - reading as latin-1")
+        return read("latin-1")
@@ -0,0 +1,66 @@
+import codecs
+import csv
+import logging
+
+from scripts.instrumentation import timed_parse
+
+logger = logging.getLogger(__name__)
+
+# Strings pandas reads as missing by default, so rows made only of these were
+# dropped by dropna when pandas was used to count rows
+na_values = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+
+def sniff_encoding(resource_file, prefix_size=65536):
+    with open(resource_file, "rb") as fp:
+        prefix = fp.read(prefix_size)
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # final=False so a character cut in half at the end of the prefix is fine
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+    except UnicodeDecodeError:
+        return "latin-1"
+    return "utf-8"
+
+
+def count_csv_rows(resource_file):
+    # Counts non-blank data rows below the header in one streaming pass without
+    # building a DataFrame. Returns (number of rows excluding any HXL hashtag
+    # row, whether there is an HXL hashtag row, encoding used).
+    encoding = sniff_encoding(resource_file)
+    try:
+        rows, hxl = count_rows(resource_file, encoding)
+    except UnicodeDecodeError:
+        # Only the prefix was checked so a bad byte can still turn up later
+        logger.warning(f"{resource_file} is not {encoding} - counting as latin-1")
+        encoding = "latin-1"
+        rows, hxl = count_rows(resource_file, encoding)
+    if hxl:
+        rows -= 1
+    return rows, hxl, encoding
+
+
+@timed_parse("csv")
+def count_rows(resource_file, encoding):
+    rows = 0
+    hxl = False
+    header = None
+    with open(resource_file, encoding=encoding, newline="") as fp:
+        for row in csv.reader(fp):
+            if not row:
+                continue
+            if header is None:
+                header = row
+                continue
+            if all(value in na_values for value in row):
+                continue
+            if rows == 0:
+                hxl = row[0].startswith("#")
+            rows += 1
+    return rows, hxl
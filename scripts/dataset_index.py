@@ -0,0 +1,44 @@
+import logging
+import re
+from threading import Lock
+
+from hdx.data.dataset import Dataset
+
+logger = logging.getLogger(__name__)
+
+
+class CODDatasetIndex:
+    # Run-scoped lookup of COD datasets by (theme, ISO), filled by one paginated
+    # search per theme instead of a read_from_hdx call per country
+    def __init__(self, themes=("ab", "em", "ps")):
+        self.themes = themes
+        self.datasets = dict()
+        self.missing = set()
+        self.loaded = False
+        self.lock = Lock()
+
+    def load(self):
+        with self.lock:
+            if not self.loaded:
+                self.load_themes()
+
+    def load_themes(self):
+        for theme in self.themes:
+            datasets = Dataset.search_in_hdx(fq=f"name:cod-{theme}-*")
+            for dataset in datasets:
+                match = re.match(f"^cod-{theme}-([a-z]{{3}})$", dataset["name"])
+                if not match:
+                    continue
+                self.datasets[(theme, match.group(1).upper())] = dataset
+        self.loaded = True
+        logger.info(f"Indexed {len(self.datasets)} COD datasets")
+
+    def get(self, theme, iso):
+        self.load()
+        key = (theme.lower(), iso.upper())
+        if key in self.missing:
+            return None
+        dataset = self.datasets.get(key)
+        if not dataset:
+            self.missing.add(key)
+        return dataset
@@ -1,31 +1,37 @@
 import logging
+from itertools import chain
 
-from hdx.data.dataset import Dataset
-from hdx.utilities.dictandlist import write_list_to_csv
+from scripts.checkpoint import write_rows_atomically
+from scripts.search_pool import cod_enhanced_query, cod_standard_query
 
 logger = logging.getLogger(__name__)
 
 
-def dataset_resource_descriptions():
+def dataset_resource_descriptions(search_pool):
 
-    datasets = Dataset.search_in_hdx(
-        fq='cod_level:"cod-standard"'
-    ) + Dataset.search_in_hdx(
-        fq='cod_level:"cod-enhanced"'
+    logger.info("Summarizing descriptions for COD datasets")
+
+    datasets = search_pool.iter_datasets(cod_standard_query, cod_enhanced_query)
+
+    headers = [
+        "country",
+        "theme",
+        "level",
+        "dataset name",
+        "item",
+        "title",
+        "description",
+    ]
+
+    count = write_rows_atomically(
+        "dataset_resource_descriptions.csv", chain([headers], describe_datasets(datasets))
     )
 
-    logger.info(f"Summarizing metadata for {len(datasets)} COD datasets")
+    logger.info(f"Wrote out {count - 1} descriptions")
+    return
 
-    results = [[
-                "country",
-                "theme",
-                "level",
-                "dataset name",
-                "item",
-                "title",
-                "description",
-            ]]
 
+def describe_datasets(datasets):
     for dataset in datasets:
         theme = None
         if dataset["name"][:6] in ["cod-ab", "cod-ps", "cod-hp", "cod-em"]:
@@ -36,32 +42,23 @@ def dataset_resource_descriptions():
 
         country = " | ".join(dataset.get_location_iso3s())
 
-        results.append(
-            [
+        yield [
+            country,
+            theme,
+            dataset["cod_level"],
+            dataset["name"],
+            "dataset",
+            dataset["title"],
+            dataset["notes"],
+        ]
+
+        for resource in dataset.get_resources():
+            yield [
                 country,
                 theme,
-                dataset["cod_level"],
+                dataset.get("cod_level"),
                 dataset["name"],
-                "dataset",
-                dataset["title"],
-                dataset["notes"],
+                "resource",
+                resource["name"],
+                resource["description"],
             ]
-        )
-
-        for resource in dataset.get_resources():
-            results.append(
-                [
-                    country,
-                    theme,
-                    dataset.get("cod_level"),
-                    dataset["name"],
-                    "resource",
-                    resource["name"],
-                    resource["description"],
-                ]
-            )
-
-    write_list_to_csv("dataset_resource_descriptions.csv", results)
-
-    logger.info("Wrote out descriptions")
-    return
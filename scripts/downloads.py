@@ -0,0 +1,89 @@
+import logging
+from os.path import getsize
+from threading import Lock, local
+
+from hdx.utilities.downloader import Download
+from hdx.utilities.uuid import get_uuid
+from scripts.instrumentation import run_report
+from scripts.scratch import ScratchSpace
+
+logger = logging.getLogger(__name__)
+
+
+class DownloaderPool:
+    # Gives each worker thread its own Download (a Download holds the response it
+    # is streaming so cannot be shared) while all of them share one rate limiter
+    def __init__(self, rate_limiter=None, cache=None, cassette=None, scratch_size=None):
+        self.rate_limiter = rate_limiter
+        self.local = local()
+        self.lock = Lock()
+        self.downloaders = list()
+        self.cache = cache
+        self.cassette = cassette
+        self.scratch = ScratchSpace(scratch_size)
+
+    def get(self):
+        downloader = getattr(self.local, "downloader", None)
+        if downloader is None:
+            downloader = Download()
+            if self.rate_limiter:
+                self.rate_limiter.mount(downloader.session)
+            if self.cassette:
+                self.cassette.mount(downloader.session)
+            with self.lock:
+                self.downloaders.append(downloader)
+            self.local.downloader = downloader
+        return downloader
+
+    def close(self):
+        for downloader in self.downloaders:
+            downloader.close()
+        if self.cache:
+            self.cache.save()
+        logger.info(f"Peak scratch space used {self.scratch.peak / 1024 / 1024:.0f}MB")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def download_resource(downloader_pool, resource, folder):
+    # Equivalent of resource.download but rate limited, served from the resource
+    # cache where possible and with a file name that cannot clash when resources,
+    # or the same resource for two scrapers, are downloaded at the same time
+    cache = downloader_pool.cache
+    if cache:
+        resource_file = cache.get(resource)
+        if resource_file:
+            run_report.add(cache_hits=1)
+            return resource_file
+    file_format = f".{resource.get_format()}"
+    filename = resource["name"]
+    if not filename.endswith(file_format):
+        filename = f"{filename}{file_format}"
+    filename = f"{resource['id']}_{get_uuid()}_{filename}"
+    scratch = downloader_pool.scratch
+    reserved = int(resource.get("size") or 0)
+    scratch.reserve(reserved)
+    try:
+        with run_report.timed("download"):
+            resource_file = downloader_pool.get().download_file(resource["url"], folder=folder, filename=filename)
+    except Exception:
+        scratch.cancel(reserved)
+        raise
+    run_report.add(download_bytes=getsize(resource_file))
+    if cache:
+        scratch.cancel(reserved)
+        return cache.put(resource, resource_file)
+    scratch.hold(resource_file, reserved)
+    return resource_file
+
+
+def release_resource(downloader_pool, resource_file):
+    # Frees the scratch space of a downloaded resource, or unpins it in the resource
+    # cache, once it has been processed
+    downloader_pool.scratch.release(resource_file)
+    if downloader_pool.cache:
+        downloader_pool.cache.release(resource_file)
@@ -0,0 +1,160 @@
+import logging
+import re
+from zipfile import BadZipFile, ZipFile
+
+from openpyxl import load_workbook
+from xlrd import XL_CELL_BLANK, XL_CELL_EMPTY, open_workbook
+
+from scripts.header_classifier import find_pcode_columns
+from scripts.instrumentation import timed_parse
+
+logger = logging.getLogger(__name__)
+
+sheet_level = re.compile("adm(in)?.?[1-7]", re.IGNORECASE)
+
+
+def find_gazetteer_resources(dataset):
+    resources = [r for r in dataset.get_resources() if r.get_format() in ["xls", "xlsx"]]
+    if len(resources) > 1:
+        resources = [r for r in resources if "gazetteer" in r["description"].lower() or
+                     "taxonomy" in r["description"].lower() or
+                     bool(re.match(".*adm.*tabular.?data.*", r["name"], re.IGNORECASE))]
+    return resources
+
+
+def count_gazetteer_units(resource_file):
+    # Counts the non-blank rows below the header row of each gazetteer sheet named
+    # like adm1 to adm7 without loading the workbook into DataFrames. Returns a
+    # dictionary of admin level to number of units.
+    with open(resource_file, "rb") as fp:
+        signature = fp.read(4)
+    if signature == b"\xd0\xcf\x11\xe0":
+        return count_xls_units(resource_file)
+    return count_xlsx_units(resource_file)
+
+
+@timed_parse("openpyxl")
+def count_xlsx_units(resource_file):
+    units = dict()
+    reliable_dimensions = has_reliable_dimensions(resource_file)
+    workbook = load_workbook(resource_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet_name in workbook.sheetnames:
+            level = sheet_level.search(sheet_name)
+            if not level:
+                continue
+            sheet = workbook[sheet_name]
+            if reliable_dimensions and sheet.max_row is not None:
+                if sheet.max_row <= 1:
+                    units[level.group()[-1]] = 0
+                    continue
+            else:
+                sheet.reset_dimensions()
+            rows = 0
+            for row in sheet.iter_rows(values_only=True):
+                if any(value is not None and value != "" for value in row):
+                    rows += 1
+            units[level.group()[-1]] = max(rows - 1, 0)
+    finally:
+        workbook.close()
+    return units
+
+
+def has_reliable_dimensions(resource_file):
+    # Excel always writes the used range of each sheet, other tools often write
+    # none or just A1 so the whole sheet has to be read to find its extent
+    try:
+        with ZipFile(resource_file) as z:
+            app = z.read("docProps/app.xml").decode("utf-8", errors="ignore")
+    except (BadZipFile, KeyError):
+        return False
+    return "<Application>Microsoft Excel</Application>" in app
+
+
+@timed_parse("xlrd")
+def count_xls_units(resource_file):
+    units = dict()
+    workbook = open_workbook(resource_file, on_demand=True)
+    try:
+        for sheet_name in workbook.sheet_names():
+            level = sheet_level.search(sheet_name)
+            if not level:
+                continue
+            sheet = workbook.sheet_by_name(sheet_name)
+            rows = 0
+            for i in range(sheet.nrows):
+                if any(
+                    cell.ctype not in (XL_CELL_EMPTY, XL_CELL_BLANK) and cell.value != ""
+                    for cell in sheet.row(i)
+                ):
+                    rows += 1
+            units[level.group()[-1]] = max(rows - 1, 0)
+            workbook.unload_sheet(sheet_name)
+    finally:
+        workbook.release_resources()
+    return units
+
+
+def get_pcode(value):
+    # Excel stores numeric p-codes as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def read_gazetteer_pcodes(resource_file):
+    # Set of the p-codes of each gazetteer sheet's own admin level, taken from
+    # the first p-code column for that level. Returns a dictionary of admin level
+    # to p-codes.
+    with open(resource_file, "rb") as fp:
+        signature = fp.read(4)
+    if signature == b"\xd0\xcf\x11\xe0":
+        return read_xls_pcodes(resource_file)
+    return read_xlsx_pcodes(resource_file)
+
+
+@timed_parse("openpyxl")
+def read_xlsx_pcodes(resource_file):
+    pcodes = dict()
+    workbook = load_workbook(resource_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet_name in workbook.sheetnames:
+            level = sheet_level.search(sheet_name)
+            if not level:
+                continue
+            level = int(level.group()[-1])
+            sheet = workbook[sheet_name]
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+            headers = [get_pcode(value) for value in next(rows, ())]
+            column = find_pcode_columns(headers).get(level)
+            if column is None:
+                continue
+            pcodes[level] = {get_pcode(row[column]) for row in rows if len(row) > column} - {""}
+    finally:
+        workbook.close()
+    return pcodes
+
+
+@timed_parse("xlrd")
+def read_xls_pcodes(resource_file):
+    pcodes = dict()
+    workbook = open_workbook(resource_file, on_demand=True)
+    try:
+        for sheet_name in workbook.sheet_names():
+            level = sheet_level.search(sheet_name)
+            if not level:
+                continue
+            level = int(level.group()[-1])
+            sheet = workbook.sheet_by_name(sheet_name)
+            if sheet.nrows > 0:
+                headers = [get_pcode(value) for value in sheet.row_values(0)]
+                column = find_pcode_columns(headers).get(level)
+                if column is not None:
+                    pcodes[level] = {get_pcode(value) for value in sheet.col_values(column, 1)} - {""}
+            workbook.unload_sheet(sheet_name)
+    finally:
+        workbook.release_resources()
+    return pcodes
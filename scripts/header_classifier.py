@@ -0,0 +1,106 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+pcode_pattern = re.compile("p?code", re.IGNORECASE)
+# Population tables use any two letter suffix, boundaries only language codes
+name_pattern = re.compile(r"name|_\D\D$", re.IGNORECASE)
+boundary_name_pattern = re.compile("name|_(en|fr|es|ru)$", re.IGNORECASE)
+level_pattern = re.compile(r"(^\d\D)|(\D\d\D)|(\D\d$)", re.IGNORECASE)
+population_pattern = re.compile("(^t_)|population|both|total|totl|proj|pop|ensemble", re.IGNORECASE)
+sex_year_pattern = re.compile("_f|_m|m_|f_|year|female|male|trans", re.IGNORECASE)
+age_pattern = re.compile(r"^\d{1,2}\D|(\D\d{1,2}\D)|(\D\d$)", re.IGNORECASE)
+age_word_pattern = re.compile("(age|adult|plus)", re.IGNORECASE)
+urban_rural_pattern = re.compile("(urban|rural)", re.IGNORECASE)
+total_pattern = re.compile("(total|totl)", re.IGNORECASE)
+year_pattern = re.compile(r"(?<!\d)\d{4}(?!\d)")
+generated_pattern = re.compile(r"field\d{1,4}")
+digit_pattern = re.compile(r"\d")
+
+HeaderClass = namedtuple(
+    "HeaderClass",
+    [
+        "pcode",
+        "name",
+        "boundary_name",
+        "population",
+        "total_population",
+        "total",
+        "years",
+        "generated",
+    ],
+)
+
+
+@lru_cache(maxsize=8192)
+def classify_header(header):
+    level = bool(level_pattern.search(header))
+    population = (
+        bool(population_pattern.search(header))
+        and not sex_year_pattern.search(header)
+        and not age_pattern.search(header)
+        and not age_word_pattern.search(header)
+        and not urban_rural_pattern.search(header)
+    )
+    return HeaderClass(
+        pcode=level and bool(pcode_pattern.search(header)),
+        name=level and bool(name_pattern.search(header)),
+        boundary_name=level and bool(boundary_name_pattern.search(header)),
+        population=population,
+        total_population=header.lower() in ["t", "t_tl"],
+        total=bool(total_pattern.search(header)),
+        years=tuple(int(y) for y in year_pattern.findall(header)),
+        generated=bool(generated_pattern.search(header)),
+    )
+
+
+def classify_headers(headers):
+    return [classify_header(header) for header in headers]
+
+
+def find_pcode_columns(headers):
+    # Index of the first p-code column of each admin level, eg. ADM2_PCODE is level 2
+    columns = dict()
+    for i, (header, header_class) in enumerate(zip(headers, classify_headers(headers))):
+        if not header_class.pcode:
+            continue
+        match = digit_pattern.search(header)
+        if match:
+            columns.setdefault(int(match.group()), i)
+    return columns
+
+
+def cache_stats():
+    info = classify_header.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+
+def pick_population_header(headers):
+    # Returns (total population header or None, candidate headers, whether the
+    # choice between several candidates was ambiguous). Candidates are joined
+    # with commas when ambiguous.
+    pop_header = list()
+    for header, header_class in zip(headers, classify_headers(headers)):
+        if len(pop_header) == 1 and classify_header(pop_header[0]).total_population:
+            continue
+        if header_class.total_population:
+            pop_header = [header]
+            continue
+        if header_class.population:
+            pop_header.append(header)
+
+    if len(pop_header) == 0:
+        return None, pop_header, False
+    if len(pop_header) == 1:
+        return pop_header[0], pop_header, False
+
+    totmatches = [classify_header(header).total for header in pop_header]
+    if sum(totmatches) == 1:
+        return pop_header[totmatches.index(True)], pop_header, False
+    yearmatches = sum([list(classify_header(header).years) for header in pop_header], [])
+    if len(yearmatches) == 0:
+        return ",".join(pop_header), pop_header, True
+    maxyear = [h for h in pop_header if str(max(yearmatches)) in h]
+    if len(maxyear) != 1:
+        return ",".join(pop_header), pop_header, True
+    return maxyear[0], pop_header, False
@@ -0,0 +1,70 @@
+import json
+import logging
+from os import replace
+from os.path import exists
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalState:
+    # Output rows of each scraper per dataset together with the dataset and
+    # resource versions they were computed from, kept between runs so that only
+    # changed datasets need to be downloaded and parsed again
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.state = dict()
+        if exists(path):
+            with open(path) as fp:
+                self.state = json.load(fp)
+        self.reused = 0
+        self.refreshed = 0
+
+    @staticmethod
+    def get_versions(dataset):
+        return {
+            "metadata_modified": dataset.get("metadata_modified"),
+            "resources": {r["id"]: r.get("last_modified") for r in dataset.get_resources()},
+        }
+
+    def get(self, scraper, dataset):
+        entry = self.state.get(scraper, dict()).get(dataset["name"])
+        if not entry:
+            return None
+        if entry["versions"] != self.get_versions(dataset):
+            return None
+        with self.lock:
+            self.reused += 1
+        return entry
+
+    def set(self, scraper, dataset, rows):
+        with self.lock:
+            self.state.setdefault(scraper, dict())[dataset["name"]] = {
+                "versions": self.get_versions(dataset),
+                "rows": rows,
+            }
+            self.refreshed += 1
+
+    def save(self):
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, "w") as fp:
+            json.dump(self.state, fp)
+        replace(temp_file, self.path)
+        logger.info(f"Incremental run reused {self.reused} and refreshed {self.refreshed} datasets")
+
+
+def run_incremental(state, scraper, dataset, function):
+    # Returns the rows stored for an unchanged dataset, otherwise calls function
+    # to compute them. function returns the rows and whether every resource could
+    # be downloaded. Rows are only stored if so, so that a dataset with a failed
+    # download is tried again on the next run rather than keeping its error row.
+    if state is None:
+        return function()[0]
+    entry = state.get(scraper, dataset)
+    if entry:
+        return entry["rows"]
+    rows, complete = function()
+    if complete:
+        state.set(scraper, dataset, rows)
+    return rows
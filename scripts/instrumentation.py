@@ -0,0 +1,124 @@
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter, time
+
+logger = logging.getLogger(__name__)
+
+current_scraper = ContextVar("current_scraper", default=None)
+current_iso = ContextVar("current_iso", default=None)
+
+
+class RunReport:
+    # Timings and counts per (scraper, ISO). Metrics recorded outside a country
+    # have ISO None and those outside a scraper have scraper None.
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time()
+        self.stats = defaultdict(lambda: defaultdict(float))
+
+    def add(self, **metrics):
+        key = (current_scraper.get(), current_iso.get())
+        with self.lock:
+            for metric, value in metrics.items():
+                self.stats[key][metric] += value
+
+    def pop_unscoped(self):
+        # Metrics recorded outside any scraper or country, removed from the report
+        with self.lock:
+            return dict(self.stats.pop((None, None), dict()))
+
+    @contextmanager
+    def scope(self, scraper=None, iso=None):
+        # Attributes everything recorded inside to the scraper and/or ISO and
+        # records the wall time spent in it
+        tokens = list()
+        if scraper:
+            tokens.append((current_scraper, current_scraper.set(scraper)))
+        if iso:
+            tokens.append((current_iso, current_iso.set(iso)))
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(wall_seconds=perf_counter() - start)
+            for variable, token in reversed(tokens):
+                variable.reset(token)
+
+    @contextmanager
+    def timed(self, prefix, **metrics):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(**{f"{prefix}_seconds": perf_counter() - start, f"{prefix}_calls": 1}, **metrics)
+
+    def get_report(self):
+        scrapers = dict()
+        for (scraper, iso), metrics in sorted(self.stats.items(), key=lambda x: (x[0][0] or "", x[0][1] or "")):
+            entry = scrapers.setdefault(scraper or "run", {"totals": defaultdict(float), "countries": dict()})
+            for metric, value in metrics.items():
+                if metric != "wall_seconds" or iso is None:
+                    entry["totals"][metric] += value
+            if iso:
+                entry["countries"][iso] = dict(metrics)
+        return {
+            "started": self.started,
+            "wall_seconds": time() - self.started,
+            "scrapers": scrapers,
+        }
+
+    def get_prometheus(self):
+        # The textfile format needs all samples of a metric together
+        samples = defaultdict(list)
+        for (scraper, iso), metrics in sorted(self.stats.items(), key=lambda x: (x[0][0] or "", x[0][1] or "")):
+            labels = f'scraper="{scraper or "run"}"'
+            if iso:
+                labels = f'{labels},iso="{iso}"'
+            for metric, value in metrics.items():
+                samples[f"cods_summary_{metric}"].append(f"{{{labels}}} {value}")
+        samples["cods_summary_run_wall_seconds"].append(f" {time() - self.started}")
+        lines = list()
+        for name in sorted(samples):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{sample}" for sample in samples[name])
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path="run_report.json", prometheus_path="run_report.prom"):
+        with open(json_path, "w") as fp:
+            json.dump(self.get_report(), fp, indent=2, sort_keys=True)
+        with open(prometheus_path, "w") as fp:
+            fp.write(self.get_prometheus())
+        logger.info(f"Wrote run report to {json_path} and {prometheus_path}")
+
+
+run_report = RunReport()
+
+
+def timed_parse(parser):
+    # Decorator recording time spent in a parsing function under the parser name
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with run_report.timed(f"parse_{parser}"):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_configuration(configuration):
+    # All HDX API calls go through call_remoteckan on the configuration
+    call_remoteckan = configuration.call_remoteckan
+
+    @wraps(call_remoteckan)
+    def wrapper(*args, **kwargs):
+        with run_report.timed("api"):
+            return call_remoteckan(*args, **kwargs)
+
+    configuration.call_remoteckan = wrapper
@@ -1,10 +1,11 @@
 import logging
+from itertools import chain
 from requests import get
 from requests.exceptions import ConnectTimeout
 from slugify import slugify
 
-from hdx.data.dataset import Dataset
-from hdx.utilities.dictandlist import write_list_to_csv
+from scripts.checkpoint import write_rows_atomically
+from scripts.search_pool import cod_enhanced_query, cod_standard_query, cod_topic_query
 
 logger = logging.getLogger(__name__)
 
@@ -13,38 +14,42 @@ lookup = "cods-summary"
 
 def metadata_summary(
     configuration,
+    search_pool,
 ):
 
-    datasets = Dataset.search_in_hdx(
-        fq='cod_level:"cod-standard"'
-    ) + Dataset.search_in_hdx(
-        fq='cod_level:"cod-enhanced"'
-    ) + Dataset.search_in_hdx(fq='vocab_Topics:"common operational dataset-cod"')
-
-    logger.info(f"Summarizing metadata for {len(datasets)} COD datasets")
-
-    results = [[
-                "COD-UID",
-                "dataset title",
-                "URL",
-                "Theme",
-                "Level",
-                "number of resource downloads",
-                "source",
-                "contributor/organization",
-                "start date of dataset",
-                "end date of dataset",
-                "updated",
-                "expected update frequency",
-                "location",
-                "visibility",
-                "license",
-                "methodology",
-                "caveats",
-                "tags",
-                "file formats",
-            ]]
+    logger.info("Summarizing metadata for COD datasets")
 
+    datasets = search_pool.iter_datasets(cod_standard_query, cod_enhanced_query, cod_topic_query)
+
+    headers = [
+        "COD-UID",
+        "dataset title",
+        "URL",
+        "Theme",
+        "Level",
+        "number of resource downloads",
+        "source",
+        "contributor/organization",
+        "start date of dataset",
+        "end date of dataset",
+        "updated",
+        "expected update frequency",
+        "location",
+        "visibility",
+        "license",
+        "methodology",
+        "caveats",
+        "tags",
+        "file formats",
+    ]
+
+    count = write_rows_atomically("datasets_tagged_cods.csv", chain([headers], summarize_datasets(datasets)))
+
+    logger.info(f"Wrote out metadata for {count - 1} COD datasets")
+    return
+
+
+def summarize_datasets(datasets):
     for dataset in datasets:
         if dataset["name"][:3] != "cod":
             continue
@@ -61,33 +66,26 @@ def metadata_summary(
         if dataset.get("is_requestdata_type"):
             visibility = "Available by request"
 
-        results.append(
-            [
-                dataset.get_hdx_url().split("/")[-1],
-                dataset.get("title"),
-                dataset.get_hdx_url(),
-                theme,
-                dataset.get("cod_level"),
-                dataset.get("total_res_downloads"),
-                dataset.get("dataset_source"),
-                dataset.get_organization()["title"],
-                dataset.get_time_period("%d-%m-%Y")["startdate_str"],
-                dataset.get_time_period("%d-%m-%Y")["enddate_str"],
-                dataset.get("last_modified"),
-                dataset.transform_update_frequency(
-                    dataset.get("data_update_frequency")
-                ),
-                " | ".join(dataset.get_location_iso3s()),
-                visibility,
-                dataset.get("license_title"),
-                methodology,
-                dataset.get("caveats"),
-                " | ".join(dataset.get_tags()),
-                " | ".join(dataset.get_filetypes()),
-            ]
-        )
-
-    write_list_to_csv("datasets_tagged_cods.csv", results)
-
-    logger.info("Wrote out metadata")
-    return
+        yield [
+            dataset.get_hdx_url().split("/")[-1],
+            dataset.get("title"),
+            dataset.get_hdx_url(),
+            theme,
+            dataset.get("cod_level"),
+            dataset.get("total_res_downloads"),
+            dataset.get("dataset_source"),
+            dataset.get_organization()["title"],
+            dataset.get_time_period("%d-%m-%Y")["startdate_str"],
+            dataset.get_time_period("%d-%m-%Y")["enddate_str"],
+            dataset.get("last_modified"),
+            dataset.transform_update_frequency(
+                dataset.get("data_update_frequency")
+            ),
+            " | ".join(dataset.get_location_iso3s()),
+            visibility,
+            dataset.get("license_title"),
+            methodology,
+            dataset.get("caveats"),
+            " | ".join(dataset.get_tags()),
+            " | ".join(dataset.get_filetypes()),
+        ]
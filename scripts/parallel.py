@@ -0,0 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from scripts.instrumentation import run_report
+
+
+def map_countries(function, countries, workers=1):
+    # Results are yielded in the order of countries whatever order workers finish
+    context = copy_context()
+
+    def run_country(country):
+        with run_report.scope(iso=country):
+            return function(country)
+
+    def run(country):
+        # Worker threads do not inherit the caller's context which says which
+        # scraper is running
+        return context.copy().run(run_country, country)
+
+    if workers <= 1:
+        yield from map(run, countries)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(run, countries)
@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from threading import BoundedSemaphore
+
+from scripts.instrumentation import run_report
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_process(function, args):
+    # Parse timings recorded in the worker process go back with the result so
+    # that they can be added to the run report of the main process
+    result = function(*args)
+    return result, run_report.pop_unscoped()
+
+
+class ParsePool:
+    # Runs CPU bound parsing of downloaded files in worker processes so that it
+    # is not limited by the GIL. Download threads hand files over with submit,
+    # which blocks once max_pending parses are waiting so that downloads cannot
+    # run far ahead of parsing. With one process parsing runs in the caller.
+    def __init__(self, processes=1, max_pending=None):
+        self.executor = None
+        if processes > 1:
+            # spawn as the pool is started from download threads and forking a
+            # process with other threads running can deadlock
+            self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"))
+            logger.info(f"Parsing in {processes} processes")
+        self.slots = BoundedSemaphore(max_pending or processes * 2)
+
+    def submit(self, function, *args):
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result((function(*args), dict()))
+            except Exception as ex:
+                future.set_exception(ex)
+            return future
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(run_in_process, function, args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def get(self, future):
+        # Result of a submitted parse with its timings recorded against the
+        # scraper and country of the calling thread
+        result, metrics = future.result()
+        if metrics:
+            run_report.add(**metrics)
+        return result
+
+    def parse(self, function, *args):
+        return self.get(self.submit(function, *args))
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,144 @@
+import logging
+import re
+from functools import partial
+
+from hdx.utilities.downloader import DownloadError
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import download_resource, release_resource
+from scripts.gazetteer import find_gazetteer_resources, read_gazetteer_pcodes
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
+from scripts.population_totals import read_population_pcodes
+
+logger = logging.getLogger(__name__)
+
+
+def pcode_consistency(
+        countries,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        workers=1,
+        parse_pool=None,
+        resume=False,
+):
+    # Not incremental as each country's rows depend on both its AB and PS datasets
+    logger.info(f"Checking p-codes of COD PS against COD AB")
+
+    results = [
+        [
+            "ISO",
+            "level",
+            "AB pcodes",
+            "PS pcodes",
+            "matched pcodes",
+            "PS pcodes not in AB",
+            "AB pcodes not in PS",
+            "PS examples not in AB",
+            "AB examples not in PS",
+            "error",
+        ]
+    ]
+
+    check = partial(
+        check_country,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("pcode_consistency.csv", resume)
+    for rows in map_countries(partial(checkpoint.run, check), countries, workers):
+        results.extend(rows)
+
+    checkpoint.finish(results)
+
+    logger.info("Wrote out p-code consistency")
+    return
+
+
+def check_country(
+        iso,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    ab_dataset = dataset_index.get("ab", iso)
+    ps_dataset = dataset_index.get("ps", iso)
+    if not ab_dataset or not ps_dataset:
+        return []
+    if ab_dataset["archived"] or ps_dataset["archived"]:
+        return []
+
+    # P-codes of every AB level are kept in sets so that each PS table is joined
+    # against them with set operations
+    ab_pcodes = dict()
+    for resource in find_gazetteer_resources(ab_dataset):
+        try:
+            resource_file = download_resource(downloader_pool, resource, temp_folder)
+        except DownloadError:
+            logger.error(f"Could not download gazetteer for COD-AB {iso}")
+            continue
+        try:
+            pcodes = parse_pool.parse(read_gazetteer_pcodes, resource_file)
+        except Exception:
+            logger.error(f"Could not open gazetteer for COD-AB {iso}")
+            continue
+        finally:
+            release_resource(downloader_pool, resource_file)
+        for adm_level, level_pcodes in pcodes.items():
+            ab_pcodes.setdefault(adm_level, set()).update(level_pcodes)
+
+    rows = list()
+    resources = [r for r in ps_dataset.get_resources() if r.get_format() == "csv"]
+    for adm_level in range(1, 5):
+        adm_resources = [
+            r for r in resources if bool(re.match(f".*adm(in)?_?{adm_level}.*", r["name"], re.IGNORECASE))
+        ]
+        if len(adm_resources) == 0:
+            continue
+        row = [iso, f"ADM{adm_level}"] + [None] * 8
+        if adm_level not in ab_pcodes:
+            row[9] = f"No ADM{adm_level} p-codes in gazetteer"
+            rows.append(row)
+            continue
+        try:
+            resource_file = download_resource(downloader_pool, adm_resources[0], temp_folder)
+        except DownloadError:
+            logger.error(f"Could not download adm{adm_level} pop spreadsheet for {iso}")
+            row[9] = f"Could not download ADM{adm_level}"
+            rows.append(row)
+            continue
+        try:
+            ps_pcodes = parse_pool.parse(read_population_pcodes, resource_file, adm_level)
+        except Exception:
+            logger.error(f"Could not open adm{adm_level} pop spreadsheet for {iso}")
+            row[9] = f"Could not read ADM{adm_level}"
+            rows.append(row)
+            continue
+        finally:
+            release_resource(downloader_pool, resource_file)
+        if ps_pcodes is None:
+            row[9] = f"No ADM{adm_level} p-code header"
+            rows.append(row)
+            continue
+        row[2:9] = compare_pcodes(ab_pcodes[adm_level], ps_pcodes)
+        rows.append(row)
+    return rows
+
+
+def compare_pcodes(ab_pcodes, ps_pcodes, examples=5):
+    # Returns (AB p-codes, PS p-codes, matched, PS orphans, AB orphans, PS orphan
+    # examples, AB orphan examples)
+    ps_orphans = ps_pcodes - ab_pcodes
+    ab_orphans = ab_pcodes - ps_pcodes
+    return [
+        len(ab_pcodes),
+        len(ps_pcodes),
+        len(ab_pcodes & ps_pcodes),
+        len(ps_orphans),
+        len(ab_orphans),
+        ", ".join(sorted(ps_orphans)[:examples]) or None,
+        ", ".join(sorted(ab_orphans)[:examples]) or None,
+    ]
@@ -0,0 +1,173 @@
+import logging
+import re
+from functools import partial
+
+from pandas import concat
+
+from hdx.utilities.downloader import DownloadError
+from scripts.checkpoint import Checkpoint
+from scripts.downloads import download_resource, release_resource
+from scripts.incremental import run_incremental
+from scripts.parallel import map_countries
+from scripts.parse_pool import ParsePool
+from scripts.population_totals import read_population_totals
+
+logger = logging.getLogger(__name__)
+
+# Relative difference between a unit's total and the sum of its children that
+# is put down to rounding
+tolerance = 0.01
+
+
+def population_reconciliation(
+        countries,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        workers=1,
+        state=None,
+        parse_pool=None,
+        resume=False,
+):
+    logger.info(f"Reconciling population totals across admin levels")
+
+    results = [
+        [
+            "ISO",
+            "level",
+            "parent level",
+            "total pop header",
+            "parent total",
+            "summed total",
+            "difference",
+            "units compared",
+            "mismatched units",
+            "unmatched pcodes",
+            "largest differences",
+            "error",
+        ]
+    ]
+
+    reconcile = partial(
+        reconcile_country,
+        dataset_index=dataset_index,
+        downloader_pool=downloader_pool,
+        temp_folder=temp_folder,
+        state=state,
+        parse_pool=parse_pool or ParsePool(),
+    )
+    checkpoint = Checkpoint("population_reconciliation.csv", resume)
+    for rows in map_countries(partial(checkpoint.run, reconcile), countries, workers):
+        results.extend(rows)
+
+    checkpoint.finish(results)
+
+    logger.info("Wrote out population reconciliation")
+    return
+
+
+def reconcile_country(
+        iso,
+        dataset_index,
+        downloader_pool,
+        temp_folder,
+        state,
+        parse_pool,
+):
+    dataset = dataset_index.get("ps", iso)
+    if not dataset:
+        return []
+    if dataset["archived"]:
+        return []
+
+    return run_incremental(
+        state,
+        "population_reconciliation",
+        dataset,
+        partial(reconcile_dataset, iso, dataset, downloader_pool, temp_folder, parse_pool),
+    )
+
+
+def reconcile_dataset(
+        iso,
+        dataset,
+        downloader_pool,
+        temp_folder,
+        parse_pool,
+):
+    resources = [r for r in dataset.get_resources() if r.get_format() == "csv"]
+
+    totals = dict()
+    complete = True
+    for adm_level in range(1, 5):
+        adm_resources = [
+            r for r in resources if bool(re.match(f".*adm(in)?_?{adm_level}.*", r["name"], re.IGNORECASE))
+        ]
+        if len(adm_resources) == 0:
+            continue
+        try:
+            resource_file = download_resource(downloader_pool, adm_resources[0], temp_folder)
+        except DownloadError:
+            logger.error(f"Could not download adm{adm_level} pop spreadsheet for {iso}")
+            totals[adm_level] = {"error": f"Could not download ADM{adm_level}"}
+            complete = False
+            continue
+        try:
+            totals[adm_level] = parse_pool.parse(read_population_totals, resource_file, adm_level)
+        except Exception:
+            logger.error(f"Could not open adm{adm_level} pop spreadsheet for {iso}")
+            totals[adm_level] = {"error": f"Could not read ADM{adm_level}"}
+        finally:
+            release_resource(downloader_pool, resource_file)
+
+    rows = list()
+    for adm_level in range(2, 5):
+        if adm_level not in totals:
+            continue
+        row = [iso, f"ADM{adm_level}", f"ADM{adm_level - 1}"] + [None] * 9
+        children = totals[adm_level]
+        parents = totals.get(adm_level - 1)
+        row[3] = children.get("total header")
+        if children["error"]:
+            row[11] = children["error"]
+        elif not parents:
+            row[11] = f"No ADM{adm_level - 1} table"
+        elif parents["error"]:
+            row[11] = parents["error"]
+        elif children["parents"] is None:
+            row[11] = f"No ADM{adm_level - 1} p-code header in ADM{adm_level}"
+        else:
+            row[4:11] = compare_totals(parents["units"], children["parents"])
+        rows.append(row)
+    return rows, complete
+
+
+def compare_totals(parent_totals, summed_totals):
+    # Lines up each parent unit's total with the sum of its children's totals by
+    # p-code. Returns (parent total, summed total, difference, units compared,
+    # mismatched units, unmatched p-codes, largest differences).
+    both = concat([parent_totals, summed_totals], axis=1, keys=["parent", "summed"])
+    matched = both.dropna()
+    differences = matched["summed"] - matched["parent"]
+    mismatched = differences[differences.abs() > tolerance * matched["parent"].abs()]
+    largest = mismatched.abs().sort_values(ascending=False).index[:5]
+    parent_total = get_number(parent_totals.sum())
+    summed_total = get_number(summed_totals.sum())
+    return [
+        parent_total,
+        summed_total,
+        get_number(summed_total - parent_total),
+        len(matched),
+        len(mismatched),
+        len(both) - len(matched),
+        ", ".join(f"{pcode} ({get_number(mismatched[pcode])})" for pcode in largest) or None,
+    ]
+
+
+def get_number(value):
+    # Whole numbers without a trailing .0 and nothing numpy specific so that rows
+    # can go in the journal
+    value = round(float(value), 2)
+    if value.is_integer():
+        return int(value)
+    return value
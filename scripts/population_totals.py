@@ -0,0 +1,54 @@
+import logging
+
+from pandas import to_numeric
+
+from scripts.csv_columns import read_csv_columns, read_csv_header
+from scripts.header_classifier import find_pcode_columns, pick_population_header
+from scripts.instrumentation import timed_parse
+
+logger = logging.getLogger(__name__)
+
+
+@timed_parse("read_csv")
+def read_population_totals(resource_file, level):
+    # Total population of each unit of a population table and the same totals
+    # summed up to the parent units, both as Series indexed by p-code. Blank and
+    # non numeric totals, like the HXL hashtag row, count as nothing.
+    totals = {"total header": None, "units": None, "parents": None, "error": None}
+    headers, encoding, delimiter, header_rows = read_csv_header(resource_file)
+    pcode_columns = find_pcode_columns(headers)
+    if level not in pcode_columns:
+        totals["error"] = f"No ADM{level} p-code header"
+        return totals
+    total_header, _, ambiguous = pick_population_header(headers)
+    if not total_header or ambiguous:
+        totals["error"] = f"No single total population header in ADM{level}"
+        return totals
+    totals["total header"] = total_header
+
+    columns = {pcode_columns[level]: "pcode", headers.index(total_header): "total"}
+    if level - 1 in pcode_columns:
+        columns[pcode_columns[level - 1]] = "parent"
+    table = read_csv_columns(resource_file, encoding, delimiter, header_rows, list(columns)).rename(
+        columns=columns
+    )
+    table["pcode"] = table["pcode"].str.strip()
+    table["total"] = to_numeric(table["total"].str.strip(), errors="coerce")
+    table = table[(table["pcode"] != "") & ~table["pcode"].str.startswith("#")]
+
+    totals["units"] = table.groupby("pcode")["total"].sum()
+    if "parent" in table:
+        totals["parents"] = table.groupby(table["parent"].str.strip())["total"].sum()
+    return totals
+
+
+@timed_parse("read_csv")
+def read_population_pcodes(resource_file, level):
+    # Set of the p-codes of a population table's own admin level, or None when it
+    # has no p-code column for that level
+    headers, encoding, delimiter, header_rows = read_csv_header(resource_file)
+    column = find_pcode_columns(headers).get(level)
+    if column is None:
+        return None
+    pcodes = read_csv_columns(resource_file, encoding, delimiter, header_rows, [column])[column].str.strip()
+    return set(pcodes[(pcodes != "") & ~pcodes.str.startswith("#")])
@@ -0,0 +1,164 @@
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import urlparse
+
+from requests.adapters import BaseAdapter
+
+from scripts.instrumentation import run_report
+
+logger = logging.getLogger(__name__)
+
+
+def get_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+def get_endpoint(url):
+    # Latency is compared per API action, with all downloads as one endpoint, as
+    # a package_search page or a download takes far longer than a small lookup
+    path = urlparse(url).path
+    if "/api/" in path:
+        return path
+    return "download"
+
+
+class TokenBucket:
+    # Paces calls to one host. Tokens go negative when callers queue up so each
+    # caller is told how long to wait for its own turn. The rate halves when the
+    # host says it is overloaded and creeps back up while responses are fine.
+    # Slow responses only take back increases above the starting rate.
+    def __init__(self, rate, min_rate, max_rate, burst=2, increase=0.1, latency_factor=2.0, window=50):
+        self.rate = rate
+        self.start_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.latency_factor = latency_factor
+        self.window = window
+        self.tokens = burst
+        self.updated = monotonic()
+        self.latencies = dict()
+        self.lock = Lock()
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        # Takes a token and returns the seconds to wait before using it
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0)
+
+    def throttle(self, retry_after=None):
+        with self.lock:
+            self.refill()
+            self.rate = max(self.rate / 2, self.min_rate)
+            # Nobody gets a token until retry_after has passed
+            self.tokens = min(self.tokens, 0) - (retry_after or 1 / self.rate) * self.rate
+            return self.rate
+
+    def record_latency(self, endpoint, latency):
+        # The smoothed latency of the endpoint is compared with its best over the
+        # last window responses, so a baseline set by one fast response expires
+        with self.lock:
+            smoothed, recent = self.latencies.get(endpoint, (None, deque(maxlen=self.window)))
+            if smoothed is None:
+                smoothed = latency
+            else:
+                smoothed = 0.8 * smoothed + 0.2 * latency
+            recent.append(smoothed)
+            self.latencies[endpoint] = (smoothed, recent)
+            if smoothed > self.latency_factor * min(recent):
+                if self.rate > self.start_rate:
+                    self.rate = max(self.rate * 0.9, self.start_rate)
+            else:
+                self.rate = min(self.rate + self.increase, self.max_rate)
+
+
+class RateLimiter:
+    # One limiter for the whole run with a token bucket per host, shared by HDX
+    # API calls and resource downloads by mounting it on their sessions
+    def __init__(self, rate=10, min_rate=0.5, max_rate=None, max_attempts=5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self.max_attempts = max_attempts
+        self.buckets = dict()
+        self.lock = Lock()
+
+    def get_bucket(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.min_rate, self.max_rate)
+                self.buckets[host] = bucket
+            return bucket
+
+    def wait(self, url):
+        delay = self.get_bucket(url).reserve()
+        if delay:
+            sleep(delay)
+
+    def mount(self, session):
+        for prefix in ("https://", "http://"):
+            adapter = session.get_adapter(prefix)
+            retries = getattr(adapter, "max_retries", None)
+            if retries is not None and retries.status_forcelist and 429 in retries.status_forcelist:
+                # 429s are handled here so that they slow down every call to the
+                # host rather than only the request that got one
+                adapter.max_retries = retries.new(
+                    status_forcelist=[status for status in retries.status_forcelist if status != 429],
+                    respect_retry_after_header=False,
+                )
+            session.mount(prefix, RateLimitAdapter(self, adapter))
+
+    def log_stats(self):
+        for host, bucket in self.buckets.items():
+            logger.info(f"Finished with {bucket.rate:.1f} calls per second to {host}")
+
+
+class RateLimitAdapter(BaseAdapter):
+    def __init__(self, rate_limiter, adapter):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        bucket = self.rate_limiter.get_bucket(request.url)
+        attempt = 1
+        while True:
+            self.rate_limiter.wait(request.url)
+            start = monotonic()
+            response = self.adapter.send(request, **kwargs)
+            if response.status_code != 429 or attempt >= self.rate_limiter.max_attempts:
+                bucket.record_latency(get_endpoint(request.url), monotonic() - start)
+                return response
+            response.close()
+            rate = bucket.throttle(get_retry_after(response.headers.get("Retry-After")))
+            run_report.add(rate_limited=1)
+            host = urlparse(request.url).netloc
+            logger.warning(f"{host} returned 429, slowing to {rate:.1f} calls per second")
+            attempt += 1
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,108 @@
+import logging
+from importlib import import_module
+from time import perf_counter
+
+from scripts.scheduler import Scraper
+
+logger = logging.getLogger(__name__)
+
+country_arguments = [
+    "countries", "dataset_index", "downloader_pool", "temp_folder", "workers", "state", "parse_pool", "resume"
+]
+
+# Functions are given as dotted paths and only imported when their scraper is
+# selected, so that a run of a light scraper does not pay for importing the GIS
+# and data frame stack
+scrapers = [
+    Scraper(
+        "metadata_summary",
+        "scripts.metadata_summary.metadata_summary",
+        ["configuration", "search_pool"],
+        [],
+        ["datasets_tagged_cods.csv"],
+    ),
+    Scraper(
+        "check_population_headers",
+        "scripts.check_population_headers.check_population_headers",
+        ["countries", "dataset_index", "downloader_pool", "temp_folder", "state", "resume"],
+        [],
+        ["population_dataset_headers.csv"],
+    ),
+    Scraper(
+        "check_boundary_fields",
+        "scripts.check_boundary_fields.check_boundary_fields",
+        ["configuration", "remote_inspection"] + country_arguments,
+        [],
+        ["boundary_dataset_headers.csv"],
+    ),
+    Scraper(
+        "cowboy_cods",
+        "scripts.cowboy_cods.cowboy_cods",
+        ["errors_on_exit", "search_pool"],
+        [],
+        [],
+    ),
+    Scraper(
+        "country_ab_summary",
+        "scripts.country_ab_summary.country_ab_summary",
+        country_arguments,
+        [],
+        ["country_ab_summary.csv"],
+    ),
+    Scraper(
+        "country_em_summary",
+        "scripts.country_em_summary.country_em_summary",
+        country_arguments,
+        [],
+        ["country_em_summary.csv"],
+    ),
+    Scraper(
+        "country_ps_summary",
+        "scripts.country_ps_summary.country_ps_summary",
+        country_arguments,
+        [],
+        ["country_ps_summary.csv"],
+    ),
+    Scraper(
+        "boundary_geometry_stats",
+        "scripts.boundary_geometry_stats.boundary_geometry_stats",
+        country_arguments,
+        [],
+        ["boundary_geometry_stats.csv"],
+    ),
+    Scraper(
+        "population_reconciliation",
+        "scripts.population_reconciliation.population_reconciliation",
+        country_arguments,
+        [],
+        ["population_reconciliation.csv"],
+    ),
+    Scraper(
+        "pcode_consistency",
+        "scripts.pcode_consistency.pcode_consistency",
+        ["countries", "dataset_index", "downloader_pool", "temp_folder", "workers", "parse_pool", "resume"],
+        [],
+        ["pcode_consistency.csv"],
+    ),
+    Scraper(
+        "dataset_resource_descriptions",
+        "scripts.dataset_resource_descriptions.dataset_resource_descriptions",
+        ["search_pool"],
+        [],
+        ["dataset_resource_descriptions.csv"],
+    ),
+]
+
+
+def load_function(path):
+    module, function = path.rsplit(".", 1)
+    return getattr(import_module(module), function)
+
+
+def get_scrapers(names):
+    start = perf_counter()
+    selected = [
+        scraper._replace(function=load_function(scraper.function)) for scraper in scrapers if scraper.name in names
+    ]
+    logger.info(f"Loaded {len(selected)} scrapers in {perf_counter() - start:.2f}s")
+    return selected
@@ -0,0 +1,100 @@
+import io
+import logging
+import re
+
+from scripts.boundary_schema import read_shapefile_zip
+from scripts.instrumentation import run_report, timed_parse
+
+logger = logging.getLogger(__name__)
+
+content_range_pattern = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class RemoteFile(io.RawIOBase):
+    # Seekable read only file over HTTP Range requests that fetches only the
+    # blocks that are read. Requests go through the session so they share its
+    # keep-alive connections and rate limit.
+    def __init__(self, session, url, block_size=65536):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.block_size = block_size
+        self.blocks = dict()
+        self.position = 0
+        self.size = None
+        self.fetch(0, 0)
+
+    def fetch(self, first, last):
+        # Fetches blocks first to last inclusive in one request
+        start = first * self.block_size
+        end = (last + 1) * self.block_size - 1
+        if self.size is not None:
+            end = min(end, self.size - 1)
+        response = self.session.get(self.url, headers={"Range": f"bytes={start}-{end}"}, stream=True)
+        try:
+            if response.status_code != 206:
+                if response.status_code == 416 and self.size is None:
+                    # An empty file has no byte 0 to ask for
+                    self.size = 0
+                    return
+                raise RangeNotSupported(f"{self.url} returned {response.status_code} to a range request")
+            match = content_range_pattern.match(response.headers.get("Content-Range", ""))
+            if not match:
+                raise RangeNotSupported(f"{self.url} returned no usable Content-Range")
+            # Later requests go straight to where any redirect led
+            self.url = response.url
+            self.size = int(match.group(3))
+            content = response.content
+        finally:
+            response.close()
+        run_report.add(range_requests=1, range_bytes=len(content))
+        for block in range(first, last + 1):
+            offset = (block - first) * self.block_size
+            if offset < len(content):
+                self.blocks[block] = content[offset:offset + self.block_size]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), max(self.size - self.position, 0))
+        if length == 0:
+            return 0
+        first = self.position // self.block_size
+        last = (self.position + length - 1) // self.block_size
+        missing = [block for block in range(first, last + 1) if block not in self.blocks]
+        if missing:
+            self.fetch(missing[0], missing[-1])
+        data = b"".join(self.blocks[block] for block in range(first, last + 1))
+        offset = self.position - first * self.block_size
+        buffer[:length] = data[offset:offset + length]
+        self.position += length
+        return length
+
+
+@timed_parse("remote_dbf")
+def inspect_remote_shapefile_zip(downloader_pool, resource):
+    # Layers of a boundary zip read from its central directory and dbf headers
+    # without downloading the whole file. Raises RangeNotSupported when the server
+    # cannot serve ranges.
+    with RemoteFile(downloader_pool.get().session, resource["url"]) as fp:
+        return read_shapefile_zip(fp)
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+from os import listdir, makedirs, remove, replace
+from os.path import basename, exists, getsize, join, splitext
+from shutil import move
+from threading import Lock
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceCache:
+    # Persistent store of downloaded resources. Files are stored once per content
+    # hash and looked up by resource id plus last_modified and hash, so unchanged
+    # resources are reused across runs. Least recently used files are evicted
+    # once the cache grows past max_size bytes. Files handed out are pinned until
+    # released so they are not evicted while they are being parsed.
+    def __init__(self, folder, max_size):
+        self.folder = folder
+        self.objects_folder = join(folder, "objects")
+        self.index_file = join(folder, "index.json")
+        self.max_size = max_size
+        self.lock = Lock()
+        makedirs(self.objects_folder, exist_ok=True)
+        self.index = {"resources": dict(), "objects": dict()}
+        if exists(self.index_file):
+            try:
+                with open(self.index_file) as fp:
+                    self.index = json.load(fp)
+            except ValueError:
+                logger.warning(f"Resource cache index {self.index_file} is corrupt - starting empty")
+        self.remove_orphans()
+        self.pins = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(resource):
+        version = resource.get("last_modified") or resource.get("metadata_modified")
+        return f"{resource['id']}|{version}|{resource.get('hash')}"
+
+    def get_path(self, object_name):
+        return join(self.objects_folder, object_name)
+
+    def get(self, resource):
+        key = self.get_key(resource)
+        with self.lock:
+            object_name = self.index["resources"].get(key)
+            if object_name and exists(self.get_path(object_name)):
+                self.index["objects"][object_name]["last_used"] = time()
+                self.pins[object_name] = self.pins.get(object_name, 0) + 1
+                self.hits += 1
+                return self.get_path(object_name)
+            self.misses += 1
+        return None
+
+    def put(self, resource, path):
+        sha256hash = hashlib.sha256()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1048576), b""):
+                sha256hash.update(chunk)
+        _, extension = splitext(path)
+        object_name = f"{sha256hash.hexdigest()}{extension.lower()}"
+        object_path = self.get_path(object_name)
+        with self.lock:
+            if object_name in self.index["objects"] and exists(object_path):
+                remove(path)
+            else:
+                move(path, object_path)
+                self.index["objects"][object_name] = {"size": getsize(object_path)}
+            self.index["objects"][object_name]["last_used"] = time()
+            self.index["resources"][self.get_key(resource)] = object_name
+            self.pins[object_name] = self.pins.get(object_name, 0) + 1
+            self.evict()
+        return object_path
+
+    def release(self, path):
+        # Unpins a file returned by get or put once its caller is done with it
+        object_name = basename(path)
+        with self.lock:
+            pins = self.pins.get(object_name)
+            if not pins:
+                return
+            if pins > 1:
+                self.pins[object_name] = pins - 1
+                return
+            del self.pins[object_name]
+            self.evict()
+
+    def evict(self):
+        objects = self.index["objects"]
+        total_size = sum(o["size"] for o in objects.values())
+        for object_name in sorted(objects, key=lambda o: objects[o]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            if object_name in self.pins:
+                continue
+            total_size -= objects.pop(object_name)["size"]
+            try:
+                remove(self.get_path(object_name))
+            except OSError:
+                pass
+        resources = self.index["resources"]
+        for key in [k for k, o in resources.items() if o not in objects]:
+            del resources[key]
+
+    def remove_orphans(self):
+        # Objects written after the index was last saved, as when a run crashed,
+        # are not in it so would never be evicted
+        objects = self.index["objects"]
+        for object_name in listdir(self.objects_folder):
+            if object_name not in objects:
+                logger.info(f"Removing {object_name} missing from the resource cache index")
+                remove(self.get_path(object_name))
+        for object_name in [o for o in objects if not exists(self.get_path(o))]:
+            del objects[object_name]
+        resources = self.index["resources"]
+        for key in [k for k, o in resources.items() if o not in objects]:
+            del resources[key]
+
+    def save(self):
+        with self.lock:
+            temp_file = f"{self.index_file}.tmp"
+            with open(temp_file, "w") as fp:
+                json.dump(self.index, fp)
+            replace(temp_file, self.index_file)
+        logger.info(f"Resource cache: {self.hits} hits, {self.misses} misses")
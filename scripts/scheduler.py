@@ -0,0 +1,67 @@
+import logging
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+
+from scripts.instrumentation import run_report
+
+logger = logging.getLogger(__name__)
+
+# arguments are taken by name from the run context, inputs are files the scraper
+# reads and outputs are files it writes. A scraper only starts once the
+# scrapers writing its inputs have finished.
+Scraper = namedtuple("Scraper", ["name", "function", "arguments", "inputs", "outputs"])
+
+
+def get_dependencies(scrapers):
+    written_by = dict()
+    for scraper in scrapers:
+        for output in scraper.outputs:
+            written_by[output] = scraper.name
+    return {
+        scraper.name: {written_by[i] for i in scraper.inputs if i in written_by}
+        for scraper in scrapers
+    }
+
+
+def run_scraper(scraper, context):
+    logger.info(f"Starting {scraper.name}")
+    start = perf_counter()
+    with run_report.scope(scraper=scraper.name):
+        scraper.function(**{argument: context[argument] for argument in scraper.arguments})
+    logger.info(f"Finished {scraper.name} in {perf_counter() - start:.1f}s")
+
+
+def run_scrapers(scrapers, context, errors_on_exit, max_concurrent=4):
+    # Runs independent scrapers concurrently. A failing scraper is reported in
+    # errors_on_exit and skips only the scrapers that depend on it.
+    dependencies = get_dependencies(scrapers)
+    pending = list(scrapers)
+    running = dict()
+    finished = set()
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max(max_concurrent, 1)) as executor:
+        while pending or running:
+            for scraper in list(pending):
+                needs = dependencies[scraper.name]
+                if needs & failed:
+                    pending.remove(scraper)
+                    failed.add(scraper.name)
+                    errors_on_exit.add(f"{scraper.name} skipped as {', '.join(sorted(needs & failed))} failed")
+                elif needs <= finished:
+                    pending.remove(scraper)
+                    running[executor.submit(run_scraper, scraper, context)] = scraper
+            if not running:
+                for scraper in pending:
+                    errors_on_exit.add(f"{scraper.name} skipped as its inputs have a circular dependency")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                scraper = running.pop(future)
+                try:
+                    future.result()
+                    finished.add(scraper.name)
+                except Exception as ex:
+                    logger.exception(f"{scraper.name} failed")
+                    errors_on_exit.add(f"{scraper.name} failed: {ex}")
+                    failed.add(scraper.name)
@@ -0,0 +1,56 @@
+import logging
+import os
+from os.path import getsize
+from threading import Condition
+
+logger = logging.getLogger(__name__)
+
+
+class ScratchSpace:
+    # Keeps the bytes of downloaded files on disk within budget. A download
+    # reserves its expected size first, blocking while the budget is used up, and
+    # the file is deleted as soon as the resource has been processed. A file larger
+    # than the whole budget is let through once nothing else is held. A budget of
+    # None is unlimited.
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.used = 0
+        self.files = dict()
+        self.condition = Condition()
+        self.peak = 0
+
+    def reserve(self, size):
+        with self.condition:
+            if self.budget:
+                while self.used > 0 and self.used + size > self.budget:
+                    self.condition.wait()
+            self.add(size)
+
+    def add(self, size):
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+    def cancel(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+    def hold(self, path, reserved):
+        # Swaps the reservation for the real size of the downloaded file
+        size = getsize(path)
+        with self.condition:
+            self.files[path] = size
+            self.add(size - reserved)
+            self.condition.notify_all()
+
+    def release(self, path):
+        # Only files downloaded into scratch space are deleted, not cached ones
+        with self.condition:
+            size = self.files.pop(path, None)
+        if size is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.cancel(size)
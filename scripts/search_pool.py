@@ -0,0 +1,160 @@
+import logging
+from queue import Full, Queue
+from threading import Lock, Thread
+from weakref import finalize
+
+from hdx.api.configuration import Configuration
+from hdx.data.dataset import Dataset
+from hdx.data.hdxobject import HDXError
+
+logger = logging.getLogger(__name__)
+
+cod_standard_query = 'cod_level:"cod-standard"'
+cod_enhanced_query = 'cod_level:"cod-enhanced"'
+cod_topic_query = 'vocab_Topics:"common operational dataset-cod"'
+
+
+def get_subscribers(scrapers, max_concurrent):
+    # Scrapers can only share a search stream if they all run at the same time,
+    # otherwise each streams its searches on its own
+    subscribers = len([scraper for scraper in scrapers if "search_pool" in scraper.arguments])
+    if subscribers > max(max_concurrent, 1):
+        return 1
+    return max(subscribers, 1)
+
+
+class Subscription:
+    def __init__(self, fqs, fields, queue_size):
+        self.fqs = fqs
+        self.fields = fields
+        self.queue = Queue(queue_size)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class SearchPool:
+    # Dataset searches shared by the metadata scrapers. Each scraper subscribes
+    # with the queries it reads and, once the expected number of subscribers
+    # have, the queries are paged through once and every page is handed to each
+    # subscriber wanting it. Pages are dropped once read so only dataset ids
+    # are kept for the whole run.
+    def __init__(self, page_size=1000, max_attempts=5, subscribers=1, queue_size=2):
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.subscribers = subscribers
+        self.queue_size = queue_size
+        self.waiting = list()
+        self.lock = Lock()
+
+    def iter_datasets(self, *fqs, fields=None):
+        # Datasets matching any of the queries, each dataset only once. fields
+        # limits the search to those fields, otherwise whole datasets are read.
+        # The subscription is made straight away rather than on the first read
+        # so the other subscribers are not kept waiting.
+        subscription = Subscription(fqs, fields, self.queue_size)
+        with self.lock:
+            self.waiting.append(subscription)
+            if len(self.waiting) >= self.subscribers:
+                group = self.waiting
+                self.waiting = list()
+                Thread(target=self.stream, args=(group,), daemon=True).start()
+        datasets = self.receive(subscription)
+        # A scraper that stops reading, or fails before it starts, must not
+        # hold up the stream for the others
+        finalize(datasets, subscription.close)
+        return datasets
+
+    def receive(self, subscription):
+        configuration = Configuration.read()
+        seen = set()
+        try:
+            while True:
+                page = subscription.queue.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for datasetdict in page:
+                    if datasetdict["id"] in seen:
+                        continue
+                    seen.add(datasetdict["id"])
+                    dataset = Dataset(configuration=configuration)
+                    dataset.old_data = dict()
+                    dataset.data = dict(datasetdict)
+                    if "resources" in datasetdict:
+                        dataset._dataset_create_resources()
+                    yield dataset
+        finally:
+            subscription.close()
+
+    def stream(self, group):
+        fqs = list()
+        for subscription in sorted(group, key=lambda s: len(s.fqs), reverse=True):
+            fqs.extend(fq for fq in subscription.fqs if fq not in fqs)
+        # Whole datasets are only asked for if a subscriber needs the nested
+        # organization, groups or resources
+        fields = None
+        if all(subscription.fields for subscription in group):
+            fields = {"id"}
+            for subscription in group:
+                fields.update(subscription.fields)
+            fields = sorted(fields)
+        try:
+            for fq in fqs:
+                subscribers = [subscription for subscription in group if fq in subscription.fqs]
+                for page in self.fetch(fq, fields):
+                    for subscription in subscribers:
+                        self.send(subscription, page)
+            for subscription in group:
+                self.send(subscription, None)
+        except Exception as ex:
+            for subscription in group:
+                self.send(subscription, ex)
+
+    @staticmethod
+    def send(subscription, page):
+        while not subscription.closed:
+            try:
+                subscription.queue.put(page, timeout=1)
+                return
+            except Full:
+                continue
+
+    def fetch(self, fq, fields=None):
+        # Yields pages until the count HDX reports has been read, as CKAN caps
+        # rows at its rows_max whatever page size is asked for. As in
+        # search_in_hdx, the search is redone if the count changes between pages
+        # or a dataset is returned twice. Datasets already yielded are left out
+        # the second time round.
+        configuration = Configuration.read()
+        data = {"q": "*:*", "fq": fq, "rows": self.page_size, "sort": "metadata_created asc"}
+        if fields:
+            data["fl"] = ",".join(fields)
+        yielded = set()
+        for _ in range(self.max_attempts):
+            counts = set()
+            ids = set()
+            duplicates = False
+            start = 0
+            while True:
+                data["start"] = start
+                result = configuration.call_remoteckan(Dataset.actions()["search"], data)
+                counts.add(result["count"])
+                page = result["results"]
+                start += len(page)
+                for datasetdict in page:
+                    if datasetdict["id"] in ids:
+                        duplicates = True
+                    ids.add(datasetdict["id"])
+                page = [datasetdict for datasetdict in page if datasetdict["id"] not in yielded]
+                yielded.update(datasetdict["id"] for datasetdict in page)
+                if page:
+                    yield page
+                if len(result["results"]) == 0 or start >= result["count"]:
+                    break
+            if len(counts) == 1 and not duplicates:
+                logger.info(f"Found {len(ids)} datasets for {fq}")
+                return
+        raise HDXError(f"Maximum attempts reached for searching for {fq}!")